@@ -68,10 +68,10 @@ def test_simple_prefix_tree_autocomplete() -> None:
     # SimplePrefixTree.autocomplete.
     assert t.autocomplete([]) == [('dog', 4.0), ('car', 3.0), ('cat', 2.0)]
 
-    # But keep in mind that the greedy algorithm here does not necessarily
-    # return the highest-weight values!! In this case, the ['c'] subtree
-    # is recursed on first.
-    assert t.autocomplete([], 1) == [('car', 3.0)]
+    # Subtrees are searched best-first by their largest leaf weight, so the
+    # highest-weight values are returned even though the ['c'] subtree has
+    # the larger aggregate weight.
+    assert t.autocomplete([], 1) == [('dog', 4.0)]
 
 
 def test_simple_prefix_tree_remove() -> None:
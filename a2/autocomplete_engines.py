@@ -14,11 +14,380 @@ testing directly! You may, however, add new private attributes, methods, and
 top-level functions to this file.
 """
 from __future__ import annotations
+from collections import OrderedDict
 import csv
-from typing import Any, Dict, List, Optional, Tuple
+import io
+import locale
+import multiprocessing
+import os
+import threading
+from typing import Any, BinaryIO, Callable, Dict, Iterable, Iterator, List, \
+    Optional, Tuple
 
 from melody import Melody
-from prefix_tree import SimplePrefixTree, CompressedPrefixTree
+from prefix_tree import Autocompleter, SimplePrefixTree, \
+    CompressedPrefixTree, VersionedPrefixTree, DecayingPrefixTree
+from sharded_prefix_tree import ShardedAutocompleter
+
+
+def _new_autocompleter(config: Dict[str, Any],
+                       classes: Iterable[type] = ()) -> Autocompleter:
+    """Return the prefix tree specified by <config>: the one saved in its
+    snapshot, if it has one, and an empty one otherwise. A tree loaded from
+    a snapshot is frozen if <config> asks for it; an empty tree is frozen by
+    the engine once it is built. The tree is wrapped
+    in a VersionedPrefixTree or a DecayingPrefixTree if <config> asks for it,
+    and split between worker processes if <config> gives a number of shards.
+    A snapshot may only hold values of the built-in types and of <classes>.
+
+    See the engine initializers for a description of <config>.
+    """
+    if config['autocompleter'] == 'simple':
+        tree_class = SimplePrefixTree
+    else:
+        # frozen trees are frozen from a compressed tree, which has fewer
+        # trees to store
+        tree_class = CompressedPrefixTree
+    if config['autocompleter'] == 'frozen' and any(
+            key in config for key in ['shards', 'versioned', 'half_life']):
+        raise ValueError('a frozen prefix tree cannot be changed')
+    if 'shards' in config:
+        if any(key in config for key in ['snapshot', 'versioned', 'half_life']):
+            raise ValueError('a sharded prefix tree is always built empty')
+        return ShardedAutocompleter(tree_class, config['weight_type'],
+                                    config['shards'],
+                                    config.get('cache_limit', 0))
+    if 'snapshot' in config:
+        tree = tree_class.load(config['snapshot'],
+                               config.get('cache_limit', 0), classes)
+        if config['autocompleter'] == 'frozen':
+            return tree.freeze()
+    else:
+        tree = tree_class(config['weight_type'], config.get('cache_limit', 0))
+    if config.get('versioned', False):
+        if 'half_life' in config:
+            raise ValueError('a versioned prefix tree cannot decay')
+        return VersionedPrefixTree(tree)
+    if 'half_life' in config:
+        return DecayingPrefixTree(tree, config['half_life'])
+    return tree
+
+
+def _new_result_cache(config: Dict[str, Any]) -> Optional[ResultCache]:
+    """Return the result cache specified by <config>, or None if it does not
+    ask for one.
+
+    See the engine initializers for a description of <config>.
+    """
+    if config.get('result_cache', 0) <= 0:
+        return None
+    if 'half_life' in config:
+        raise ValueError('the results of a decaying prefix tree change '
+                         'over time, so they cannot be cached')
+    return ResultCache(config['result_cache'])
+
+
+class ResultCache:
+    """A bounded cache of autocomplete results, evicting the least recently
+    used result first.
+
+    Results are keyed by the prefix (as the list passed to the Autocompleter)
+    and the limit of their query. Changing the values that match a prefix
+    only invalidates the results of queries whose prefix is related to it,
+    so results for the rest of the tree stay cached.
+
+    The cache can be used by several threads at once. Results are computed
+    without holding its lock, and a result is not cached if anything was
+    invalidated while it was computed, since it may be out of date.
+
+    === Attributes ===
+    capacity:
+        The largest number of results kept.
+    hits:
+        The number of queries answered from the cache.
+    misses:
+        The number of queries that were not cached.
+    evictions:
+        The number of results dropped to make room for new ones.
+    invalidations:
+        The number of results dropped because their matches changed.
+    _results:
+        The cached results, keyed by (prefix tuple, limit), from the least
+        to the most recently used.
+    _limits:
+        The limits of the cached results of each prefix tuple.
+    _extensions:
+        For every prefix tuple p, the cached prefix tuples that start with
+        p (including p itself, if it is cached).
+    _generation:
+        The number of invalidate calls so far.
+    _lock:
+        Held while the cache is read or changed.
+    """
+    capacity: int
+    hits: int
+    misses: int
+    evictions: int
+    invalidations: int
+    _results: OrderedDict
+    _limits: Dict[Tuple, set]
+    _extensions: Dict[Tuple, set]
+    _generation: int
+    _lock: threading.Lock
+
+    def __init__(self, capacity: int) -> None:
+        """Initialize an empty cache holding at most <capacity> results.
+
+        Precondition: capacity > 0
+        """
+        self.capacity = capacity
+        self.hits = self.misses = self.evictions = self.invalidations = 0
+        self._results = OrderedDict()
+        self._limits = {}
+        self._extensions = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        """Return the number of cached results."""
+        with self._lock:
+            return len(self._results)
+
+    def lookup(self, prefix: List, limit: Optional[int],
+               compute: Callable[[List, Optional[int]],
+                                 List[Tuple[Any, float]]]
+               ) -> List[Tuple[Any, float]]:
+        """Return the cached result of the query (<prefix>, <limit>), or
+        cache and return compute(prefix, limit) if it is not cached.
+        """
+        key = (tuple(prefix), limit)
+        with self._lock:
+            if key in self._results:
+                self.hits += 1
+                self._results.move_to_end(key)
+                return list(self._results[key])
+            self.misses += 1
+            generation = self._generation
+        result = compute(prefix, limit)
+        with self._lock:
+            if generation == self._generation:
+                self._store(key, result)
+        return list(result)
+
+    def lookup_batch(self, prefixes: List[List], limit: Optional[int],
+                     compute: Callable[[List[List], Optional[int]],
+                                       List[List[Tuple[Any, float]]]]
+                     ) -> List[List[Tuple[Any, float]]]:
+        """Return the result of the query (prefix, <limit>) for every prefix
+        in <prefixes>, computing the ones that are not cached with a single
+        call compute(uncached prefixes, limit).
+        """
+        results = [None] * len(prefixes)
+        missing = []
+        with self._lock:
+            for i, prefix in enumerate(prefixes):
+                key = (tuple(prefix), limit)
+                if key in self._results:
+                    self.hits += 1
+                    self._results.move_to_end(key)
+                    results[i] = list(self._results[key])
+                else:
+                    missing.append(i)
+            self.misses += len(missing)
+            generation = self._generation
+        computed = compute([prefixes[i] for i in missing], limit) \
+            if missing else []
+        with self._lock:
+            for i, result in zip(missing, computed):
+                if generation == self._generation:
+                    self._store((tuple(prefixes[i]), limit), result)
+                results[i] = list(result)
+        return results
+
+    def _store(self, key: Tuple[Tuple, Optional[int]],
+               result: List[Tuple[Any, float]]) -> None:
+        """Cache <result> under <key>, evicting the least recently used
+        results if the cache is full.
+
+        Precondition: self._lock is held.
+        """
+        if key not in self._results:
+            prefix = key[0]
+            self._limits.setdefault(prefix, set()).add(key[1])
+            for i in range(len(prefix) + 1):
+                self._extensions.setdefault(prefix[:i], set()).add(prefix)
+        self._results[key] = list(result)
+        self._results.move_to_end(key)
+        while len(self._results) > self.capacity:
+            self._drop(next(iter(self._results)))
+            self.evictions += 1
+
+    def _drop(self, key: Tuple[Tuple, Optional[int]]) -> None:
+        """Remove the result cached under <key>.
+
+        Precondition: self._lock is held.
+        """
+        del self._results[key]
+        prefix, limit = key
+        self._limits[prefix].discard(limit)
+        if len(self._limits[prefix]) > 0:
+            return
+        del self._limits[prefix]
+        for i in range(len(prefix) + 1):
+            extensions = self._extensions[prefix[:i]]
+            extensions.discard(prefix)
+            if len(extensions) == 0:
+                del self._extensions[prefix[:i]]
+
+    def _drop_prefix(self, prefix: Tuple) -> None:
+        """Remove every result cached for <prefix>.
+
+        Precondition: self._lock is held.
+        """
+        for limit in list(self._limits.get(prefix, ())):
+            self._drop((prefix, limit))
+            self.invalidations += 1
+
+    def invalidate_insert(self, prefix: List) -> None:
+        """Remove the cached results that may change when a value with the
+        prefix sequence <prefix> is inserted: those of the prefixes of
+        <prefix>.
+        """
+        prefix = tuple(prefix)
+        with self._lock:
+            self._generation += 1
+            for i in range(len(prefix) + 1):
+                self._drop_prefix(prefix[:i])
+
+    def invalidate_remove(self, prefix: List) -> None:
+        """Remove the cached results that may change when the values
+        matching <prefix> are removed: those of the prefixes of <prefix>,
+        and of the prefixes that start with <prefix>.
+        """
+        prefix = tuple(prefix)
+        with self._lock:
+            self._generation += 1
+            for extension in list(self._extensions.get(prefix, ())):
+                self._drop_prefix(extension)
+            for i in range(len(prefix)):
+                self._drop_prefix(prefix[:i])
+
+    def stats(self) -> Dict[str, int]:
+        """Return the counters of this cache and its number of results."""
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses,
+                    'evictions': self.evictions,
+                    'invalidations': self.invalidations,
+                    'size': len(self._results)}
+
+
+def _sanitize(text: str) -> str:
+    """Return <text> in lowercase, without the characters that are neither
+    alphanumeric nor spaces.
+    """
+    value = ''
+    for char in text.lower():
+        if char.isalnum() or char == ' ':
+            value += char
+    return value
+
+
+def _letter_entries(lines: Iterable[str]) -> List[Tuple[str, float, List[str]]]:
+    """Return the (value, weight, prefix) entries of a letter engine for the
+    given lines of its input file, in order.
+    """
+    entries = []
+    for line in lines:
+        value = _sanitize(line)
+        if value != '':
+            entries.append((value, 1.0, list(value)))
+    return entries
+
+
+def _sentence_entries(lines: Iterable[str]
+                      ) -> List[Tuple[str, float, List[str]]]:
+    """Return the (value, weight, prefix) entries of a sentence engine for
+    the given lines of its CSV input file, in order.
+    """
+    entries = []
+    for line in csv.reader(lines):
+        value = _sanitize(line[0])
+        if value != '':
+            entries.append((value, float(line[1]), value.split()))
+    return entries
+
+
+def _line_start(f: BinaryIO, offset: int) -> int:
+    """Return the offset of the first line of the file <f> that starts at or
+    after <offset>, or the size of <f> if there is no such line.
+    """
+    if offset == 0:
+        return 0
+    f.seek(offset - 1)
+    f.readline()
+    return f.tell()
+
+
+def _read_range(path: str, start: int, end: int, encoding: str,
+                parse: Callable[[Iterable[str]], List[Tuple[Any, float, List]]]
+                ) -> List[Tuple[Any, List, List[float]]]:
+    """Return the entries that <parse> finds in the lines of the file <path>
+    starting between bytes <start> (included) and <end> (excluded), grouped
+    by value: a (value, prefix, weights) tuple for each value, in the order
+    of their first line, with the weights of all of its lines in order.
+
+    The lines are decoded with <encoding> and their line endings translated
+    as in a file opened in text mode, so <parse> sees them exactly as a
+    sequential read would.
+    """
+    with open(path, 'rb') as f:
+        begin = _line_start(f, start)
+        stop = _line_start(f, end)
+        f.seek(begin)
+        data = f.read(stop - begin)
+    grouped = {}
+    for value, weight, prefix in parse(io.StringIO(data.decode(encoding),
+                                                   newline=None)):
+        if value in grouped:
+            grouped[value][2].append(weight)
+        else:
+            grouped[value] = (value, prefix, [weight])
+    return list(grouped.values())
+
+
+def _parallel_entries(path: str, workers: int, encoding: str,
+                      parse: Callable[[Iterable[str]],
+                                      List[Tuple[Any, float, List]]]
+                      ) -> List[Tuple[Any, float, List]]:
+    """Return the entries that <parse> finds in the file <path>, read and
+    parsed in byte ranges by a pool of <workers> processes.
+
+    Each worker groups the entries of its range by value, so each prefix is
+    sent back once per range. The entries of every value are returned
+    together, in the order of the first line of each value and with their
+    weights in the order of their lines, so bulk loading them merges every
+    value exactly as bulk loading the entries of a sequential read would.
+
+    Precondition: no line of the file is part of a record that spans lines.
+    """
+    size = os.path.getsize(path)
+    # more ranges than workers, so that a slow range does not hold up the rest
+    ranges = workers * 4
+    bounds = [size * i // ranges for i in range(ranges + 1)]
+    with multiprocessing.Pool(workers) as pool:
+        parts = pool.starmap(_read_range, [
+            (path, bounds[i], bounds[i + 1], encoding, parse)
+            for i in range(ranges)])
+    merged = {}
+    for part in parts:
+        for value, prefix, weights in part:
+            if value in merged:
+                merged[value][1].extend(weights)
+            else:
+                merged[value] = (prefix, weights)
+    return [(value, weight, prefix)
+            for value, (prefix, weights) in merged.items()
+            for weight in weights]
 
 
 ################################################################################
@@ -36,8 +405,11 @@ class LetterAutocompleteEngine:
 
     === Attributes ===
     autocompleter: An Autocompleter used by this engine.
+    result_cache: The cache of the autocomplete results of this engine, or
+                  None if they are not cached.
     """
     autocompleter: Autocompleter
+    result_cache: Optional[ResultCache]
 
     def __init__(self, config: Dict[str, Any]) -> None:
         """Initialize this engine with the given configuration.
@@ -45,9 +417,34 @@ class LetterAutocompleteEngine:
         <config> is a dictionary consisting of the following keys:
             - 'file': the path to a text file
             - 'autocompleter': either the string 'simple' or 'compressed',
-              specifying which subclass of Autocompleter to use.
+              specifying which subclass of Autocompleter to use, or
+              'frozen' for a read-only FrozenPrefixTree frozen from a
+              compressed prefix tree once it is built.
             - 'weight_type': either 'sum' or 'average', which specifies the
               weight type for the prefix tree.
+            - 'cache_limit' (optional): the number of top matches cached at
+              every non-leaf node of the prefix tree (default 0, no caching).
+            - 'snapshot' (optional): the path of a file written by the
+              save method of this engine's autocompleter. If given, the
+              prefix tree is loaded from it, and 'file' and 'weight_type'
+              are ignored. Loading a snapshot cannot run code (see
+              SimplePrefixTree.load).
+            - 'versioned' (optional): if True, the prefix tree is a
+              VersionedPrefixTree, so that it can be queried by many threads
+              while one thread inserts or removes values (default False).
+            - 'half_life' (optional): if given, the prefix tree is a
+              DecayingPrefixTree whose weights are halved every 'half_life'
+              seconds. It cannot be combined with 'versioned'.
+            - 'shards' (optional): if given, the values are split between
+              this many worker processes, each with its own prefix tree (see
+              ShardedAutocompleter). It cannot be combined with 'snapshot',
+              'versioned' or 'half_life'.
+            - 'result_cache' (optional): the number of autocomplete results
+              kept in a ResultCache (default 0, no cache). It cannot be
+              combined with 'half_life'.
+            - 'workers' (optional): if greater than 1, the file is read and
+              sanitized by this many processes, each reading a range of its
+              lines (default 1). The result is the same as with one process.
 
         Each line of the specified file counts as one input string.
         Note that the line may or may not contain spaces.
@@ -65,20 +462,19 @@ class LetterAutocompleteEngine:
         # We've opened the file for you here. You should iterate over the
         # lines of the file and process them according to the description in
         # this method's docstring.
-        if config['autocompleter'] == 'simple':
-            self.autocompleter = SimplePrefixTree(config['weight_type'])
+        self.result_cache = _new_result_cache(config)
+        self.autocompleter = _new_autocompleter(config)
+        if 'snapshot' in config:
+            return
+        if config.get('workers', 1) > 1:
+            entries = _parallel_entries(config['file'], config['workers'],
+                                        'utf8', _letter_entries)
         else:
-            self.autocompleter = CompressedPrefixTree(config['weight_type'])
-        with open(config['file'], encoding='utf8') as f:
-            for line in f:
-                value = ''
-                prefix = []
-                for char in line.lower():
-                    if char.isalnum() or char == ' ':
-                        value += char
-                        prefix.append(char)
-                if value != '':
-                    self.autocompleter.insert(value, 1.0, prefix)
+            with open(config['file'], encoding='utf8') as f:
+                entries = _letter_entries(f)
+        self.autocompleter.bulk_load(entries)
+        if config['autocompleter'] == 'frozen':
+            self.autocompleter = self.autocompleter.freeze()
 
     def autocomplete(self, prefix: str,
                      limit: Optional[int] = None) -> List[Tuple[str, float]]:
@@ -99,7 +495,68 @@ class LetterAutocompleteEngine:
         pre = []
         for char in prefix:
             pre.append(char)
-        return self.autocompleter.autocomplete(pre, limit)
+        if self.result_cache is None:
+            return self.autocompleter.autocomplete(pre, limit)
+        return self.result_cache.lookup(pre, limit,
+                                        self.autocompleter.autocomplete)
+
+    def fuzzy_autocomplete(self, prefix: str, max_distance: int = 1,
+                           limit: Optional[int] = None
+                           ) -> List[Tuple[str, float]]:
+        """Return up to <limit> strings that start with a string at most
+        <max_distance> letter insertions, deletions or substitutions away
+        from the given prefix string, as tuples (string, weight).
+
+        Matches are ordered by that distance first, and then in non-increasing
+        weight, so exact matches come before corrected ones.
+
+        Preconditions:
+            max_distance >= 0, and limit is None or limit > 0
+            <prefix> contains only lowercase alphanumeric characters and spaces
+        """
+        return self.autocompleter.fuzzy_autocomplete(list(prefix),
+                                                     max_distance, limit)
+
+    def iter_autocomplete(self, prefix: str) -> Iterator[Tuple[str, float]]:
+        """Yield every match for the given prefix string as a tuple
+        (string, weight), in non-increasing order of weight.
+
+        Matches are computed only as they are consumed, so callers that show
+        a page of results at a time should prefer this to autocomplete.
+
+        Precondition:
+            <prefix> contains only lowercase alphanumeric characters and spaces
+        """
+        return self.autocompleter.iter_autocomplete(list(prefix))
+
+    def batch_autocomplete(self, prefixes: List[str],
+                           limit: Optional[int] = None
+                           ) -> List[List[Tuple[str, float]]]:
+        """Return the result of autocomplete(prefix, limit) for every prefix
+        string in <prefixes>, in the same order.
+
+        Preconditions:
+            limit is None or limit > 0
+            every prefix contains only lowercase alphanumeric characters and
+            spaces
+        """
+        prefixes = [list(prefix) for prefix in prefixes]
+        if self.result_cache is None:
+            return self.autocompleter.batch_autocomplete(prefixes, limit)
+        return self.result_cache.lookup_batch(
+            prefixes, limit, self.autocompleter.batch_autocomplete)
+
+    def insert(self, string: str, weight: float = 1.0) -> None:
+        """Sanitize <string> as the lines of the input file are, and insert
+        it with <weight> if the result is not empty.
+
+        Precondition: weight > 0
+        """
+        value = _sanitize(string)
+        if value != '':
+            self.autocompleter.insert(value, weight, list(value))
+            if self.result_cache is not None:
+                self.result_cache.invalidate_insert(list(value))
 
     def remove(self, prefix: str) -> None:
         """Remove all strings that match the given prefix string.
@@ -114,6 +571,8 @@ class LetterAutocompleteEngine:
         for char in prefix:
             pre.append(char)
         self.autocompleter.remove(pre)
+        if self.result_cache is not None:
+            self.result_cache.invalidate_remove(pre)
 
 
 class SentenceAutocompleteEngine:
@@ -129,8 +588,11 @@ class SentenceAutocompleteEngine:
 
     === Attributes ===
     autocompleter: An Autocompleter used by this engine.
+    result_cache: The cache of the autocomplete results of this engine, or
+                  None if they are not cached.
     """
     autocompleter: Autocompleter
+    result_cache: Optional[ResultCache]
 
     def __init__(self, config: Dict[str, Any]) -> None:
         """Initialize this engine with the given configuration.
@@ -138,9 +600,34 @@ class SentenceAutocompleteEngine:
         <config> is a dictionary consisting of the following keys:
             - 'file': the path to a CSV file
             - 'autocompleter': either the string 'simple' or 'compressed',
-              specifying which subclass of Autocompleter to use.
+              specifying which subclass of Autocompleter to use, or
+              'frozen' for a read-only FrozenPrefixTree frozen from a
+              compressed prefix tree once it is built.
             - 'weight_type': either 'sum' or 'average', which specifies the
               weight type for the prefix tree.
+            - 'cache_limit' (optional): the number of top matches cached at
+              every non-leaf node of the prefix tree (default 0, no caching).
+            - 'snapshot' (optional): the path of a file written by the
+              save method of this engine's autocompleter. If given, the
+              prefix tree is loaded from it, and 'file' and 'weight_type'
+              are ignored. Loading a snapshot cannot run code (see
+              SimplePrefixTree.load).
+            - 'versioned' (optional): if True, the prefix tree is a
+              VersionedPrefixTree, so that it can be queried by many threads
+              while one thread inserts or removes values (default False).
+            - 'half_life' (optional): if given, the prefix tree is a
+              DecayingPrefixTree whose weights are halved every 'half_life'
+              seconds. It cannot be combined with 'versioned'.
+            - 'shards' (optional): if given, the values are split between
+              this many worker processes, each with its own prefix tree (see
+              ShardedAutocompleter). It cannot be combined with 'snapshot',
+              'versioned' or 'half_life'.
+            - 'result_cache' (optional): the number of autocomplete results
+              kept in a ResultCache (default 0, no cache). It cannot be
+              combined with 'half_life'.
+            - 'workers' (optional): if greater than 1, the file is read and
+              sanitized by this many processes, each reading a range of its
+              lines (default 1). The result is the same as with one process.
 
         Precondition:
         The given file is a *CSV file* where each line has two entries:
@@ -162,20 +649,21 @@ class SentenceAutocompleteEngine:
         """
         # We haven't given you any starter code here! You should review how
         # you processed CSV files on Assignment 1.
-        if config['autocompleter'] == 'simple':
-            self.autocompleter = SimplePrefixTree(config['weight_type'])
+        self.result_cache = _new_result_cache(config)
+        self.autocompleter = _new_autocompleter(config)
+        if 'snapshot' in config:
+            return
+        if config.get('workers', 1) > 1:
+            # the encoding that open uses by default
+            entries = _parallel_entries(config['file'], config['workers'],
+                                        locale.getpreferredencoding(False),
+                                        _sentence_entries)
         else:
-            self.autocompleter = CompressedPrefixTree(config['weight_type'])
-        with open(config['file']) as csvfile:
-            reader = csv.reader(csvfile)
-            for line in reader:
-                value = ''
-                for char in line[0].lower():
-                    if char.isalnum() or char == ' ':
-                        value += char
-                prefix = value.split()
-                if value != '':
-                    self.autocompleter.insert(value, float(line[1]), prefix)
+            with open(config['file']) as csvfile:
+                entries = _sentence_entries(csvfile)
+        self.autocompleter.bulk_load(entries)
+        if config['autocompleter'] == 'frozen':
+            self.autocompleter = self.autocompleter.freeze()
 
     def autocomplete(self, prefix: str,
                      limit: Optional[int] = None) -> List[Tuple[str, float]]:
@@ -194,7 +682,68 @@ class SentenceAutocompleteEngine:
             <prefix> contains only lowercase alphanumeric characters and spaces
         """
         pre = prefix.split()
-        return self.autocompleter.autocomplete(pre, limit)
+        if self.result_cache is None:
+            return self.autocompleter.autocomplete(pre, limit)
+        return self.result_cache.lookup(pre, limit,
+                                        self.autocompleter.autocomplete)
+
+    def fuzzy_autocomplete(self, prefix: str, max_distance: int = 1,
+                           limit: Optional[int] = None
+                           ) -> List[Tuple[str, float]]:
+        """Return up to <limit> strings that start with a sentence at most
+        <max_distance> word insertions, deletions or substitutions away from
+        the given prefix string, as tuples (string, weight).
+
+        Matches are ordered by that distance first, and then in non-increasing
+        weight.
+
+        Preconditions:
+            max_distance >= 0, and limit is None or limit > 0
+            <prefix> contains only lowercase alphanumeric characters and spaces
+        """
+        return self.autocompleter.fuzzy_autocomplete(prefix.split(),
+                                                     max_distance, limit)
+
+    def iter_autocomplete(self, prefix: str) -> Iterator[Tuple[str, float]]:
+        """Yield every match for the given prefix string as a tuple
+        (string, weight), in non-increasing order of weight.
+
+        Matches are computed only as they are consumed, so callers that show
+        a page of results at a time should prefer this to autocomplete.
+
+        Precondition:
+            <prefix> contains only lowercase alphanumeric characters and spaces
+        """
+        return self.autocompleter.iter_autocomplete(prefix.split())
+
+    def batch_autocomplete(self, prefixes: List[str],
+                           limit: Optional[int] = None
+                           ) -> List[List[Tuple[str, float]]]:
+        """Return the result of autocomplete(prefix, limit) for every prefix
+        string in <prefixes>, in the same order.
+
+        Preconditions:
+            limit is None or limit > 0
+            every prefix contains only lowercase alphanumeric characters and
+            spaces
+        """
+        prefixes = [prefix.split() for prefix in prefixes]
+        if self.result_cache is None:
+            return self.autocompleter.batch_autocomplete(prefixes, limit)
+        return self.result_cache.lookup_batch(
+            prefixes, limit, self.autocompleter.batch_autocomplete)
+
+    def insert(self, string: str, weight: float) -> None:
+        """Sanitize <string> as the strings of the input file are, and
+        insert it with <weight> if the result is not empty.
+
+        Precondition: weight > 0
+        """
+        value = _sanitize(string)
+        if value != '':
+            self.autocompleter.insert(value, weight, value.split())
+            if self.result_cache is not None:
+                self.result_cache.invalidate_insert(value.split())
 
     def remove(self, prefix: str) -> None:
         """Remove all strings that match the given prefix.
@@ -207,6 +756,8 @@ class SentenceAutocompleteEngine:
         """
         pre = prefix.split()
         self.autocompleter.remove(pre)
+        if self.result_cache is not None:
+            self.result_cache.invalidate_remove(pre)
 
 
 ################################################################################
@@ -224,8 +775,11 @@ class MelodyAutocompleteEngine:
 
     # === Private Attributes ===
     autocompleter: An Autocompleter used by this engine.
+    result_cache: The cache of the autocomplete results of this engine, or
+                  None if they are not cached.
     """
     autocompleter: Autocompleter
+    result_cache: Optional[ResultCache]
 
     def __init__(self, config: Dict[str, Any]) -> None:
         """Initialize this engine with the given configuration.
@@ -233,9 +787,31 @@ class MelodyAutocompleteEngine:
         <config> is a dictionary consisting of the following keys:
             - 'file': the path to a CSV file
             - 'autocompleter': either the string 'simple' or 'compressed',
-              specifying which subclass of Autocompleter to use.
+              specifying which subclass of Autocompleter to use, or
+              'frozen' for a read-only FrozenPrefixTree frozen from a
+              compressed prefix tree once it is built.
             - 'weight_type': either 'sum' or 'average', which specifies the
               weight type for the prefix tree.
+            - 'cache_limit' (optional): the number of top matches cached at
+              every non-leaf node of the prefix tree (default 0, no caching).
+            - 'snapshot' (optional): the path of a file written by the
+              save method of this engine's autocompleter. If given, the
+              prefix tree is loaded from it, and 'file' and 'weight_type'
+              are ignored. Loading a snapshot cannot run code (see
+              SimplePrefixTree.load).
+            - 'versioned' (optional): if True, the prefix tree is a
+              VersionedPrefixTree, so that it can be queried by many threads
+              while one thread inserts or removes values (default False).
+            - 'half_life' (optional): if given, the prefix tree is a
+              DecayingPrefixTree whose weights are halved every 'half_life'
+              seconds. It cannot be combined with 'versioned'.
+            - 'shards' (optional): if given, the values are split between
+              this many worker processes, each with its own prefix tree (see
+              ShardedAutocompleter). It cannot be combined with 'snapshot',
+              'versioned' or 'half_life'.
+            - 'result_cache' (optional): the number of autocomplete results
+              kept in a ResultCache (default 0, no cache). It cannot be
+              combined with 'half_life'.
 
         Precondition:
         The given file is a *CSV file* where each line has the following format:
@@ -252,10 +828,11 @@ class MelodyAutocompleteEngine:
         """
         # We haven't given you any starter code here! You should review how
         # you processed CSV files on Assignment 1.
-        if config['autocompleter'] == 'simple':
-            self.autocompleter = SimplePrefixTree(config['weight_type'])
-        else:
-            self.autocompleter = CompressedPrefixTree(config['weight_type'])
+        self.result_cache = _new_result_cache(config)
+        self.autocompleter = _new_autocompleter(config, [Melody])
+        if 'snapshot' in config:
+            return
+        entries = []
         with open(config['file']) as csvfile:
             reader = csv.reader(csvfile)
             for line in reader:
@@ -271,7 +848,10 @@ class MelodyAutocompleteEngine:
                             inter = int(line[i]) - int(line[i - 2])
                             interval.append(inter)
                         i = i + 2
-                    self.autocompleter.insert(melody, 1.0, interval)
+                    entries.append((melody, 1.0, interval))
+        self.autocompleter.bulk_load(entries)
+        if config['autocompleter'] == 'frozen':
+            self.autocompleter = self.autocompleter.freeze()
 
     def autocomplete(self, prefix: List[int],
                      limit: Optional[int] = None) -> List[Tuple[Melody, float]]:
@@ -285,12 +865,68 @@ class MelodyAutocompleteEngine:
         Precondition:
             limit is None or limit > 0
         """
-        return self.autocompleter.autocomplete(prefix, limit)
+        if self.result_cache is None:
+            return self.autocompleter.autocomplete(prefix, limit)
+        return self.result_cache.lookup(prefix, limit,
+                                        self.autocompleter.autocomplete)
+
+    def fuzzy_autocomplete(self, prefix: List[int], max_distance: int = 1,
+                           limit: Optional[int] = None
+                           ) -> List[Tuple[Melody, float]]:
+        """Return up to <limit> melodies whose interval sequence starts with
+        one at most <max_distance> interval insertions, deletions or
+        substitutions away from <prefix>, as tuples (melody, weight).
+
+        Matches are ordered by that distance first, and then in non-increasing
+        weight.
+
+        Precondition:
+            max_distance >= 0, and limit is None or limit > 0
+        """
+        return self.autocompleter.fuzzy_autocomplete(prefix, max_distance,
+                                                     limit)
+
+    def iter_autocomplete(self, prefix: List[int]
+                          ) -> Iterator[Tuple[Melody, float]]:
+        """Yield every match for the given interval sequence as a tuple
+        (melody, weight), in non-increasing order of weight.
+
+        Matches are computed only as they are consumed.
+        """
+        return self.autocompleter.iter_autocomplete(prefix)
+
+    def batch_autocomplete(self, prefixes: List[List[int]],
+                           limit: Optional[int] = None
+                           ) -> List[List[Tuple[Melody, float]]]:
+        """Return the result of autocomplete(prefix, limit) for every interval
+        sequence in <prefixes>, in the same order.
+
+        Precondition:
+            limit is None or limit > 0
+        """
+        if self.result_cache is None:
+            return self.autocompleter.batch_autocomplete(prefixes, limit)
+        return self.result_cache.lookup_batch(
+            prefixes, limit, self.autocompleter.batch_autocomplete)
+
+    def insert(self, melody: Melody, weight: float = 1.0) -> None:
+        """Insert <melody> with <weight>, under the sequence of intervals
+        between its notes.
+
+        Precondition: weight > 0
+        """
+        interval = [melody.notes[i][0] - melody.notes[i - 1][0]
+                    for i in range(1, len(melody.notes))]
+        self.autocompleter.insert(melody, weight, interval)
+        if self.result_cache is not None:
+            self.result_cache.invalidate_insert(interval)
 
     def remove(self, prefix: List[int]) -> None:
         """Remove all melodies that match the given interval sequence.
         """
         self.autocompleter.remove(prefix)
+        if self.result_cache is not None:
+            self.result_cache.invalidate_remove(prefix)
 
 
 ###############################################################################
@@ -338,11 +974,6 @@ if __name__ == '__main__':
 #         'extra-imports': ['csv', 'prefix_tree', 'melody']
 #     })
 
-    # This is used to increase the recursion limit so that your sample runs
-    # work even for fairly tall simple prefix trees.
-    import sys
-    sys.setrecursionlimit(5000)
-
     # print(sample_letter_autocomplete())
     # print(sample_sentence_autocomplete())
     sample_melody_autocomplete()
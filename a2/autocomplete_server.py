@@ -0,0 +1,338 @@
+"""CSC148 Assignment 2: Autocomplete server
+
+=== Module description ===
+This file serves any of the three autocomplete engines on a local TCP or Unix
+socket, using only the standard library.
+
+Clients send one JSON object per line, and get one JSON object per line back
+for each request, in the order in which the requests are answered (which
+may differ from the order in which they were sent). A request is an object
+with an "op" key:
+    - {"op": "autocomplete", "prefix": ..., "limit": ...}
+    - {"op": "fuzzy_autocomplete", "prefix": ..., "max_distance": ...,
+       "limit": ...}
+    - {"op": "remove", "prefix": ...}
+    - {"op": "stats"}
+The prefix is a string for the letter and sentence engines, and a list of
+intervals for the melody engine. "limit" and "max_distance" (at most
+MAX_DISTANCE) may be left out.
+Any "id" in a request is copied into its response.
+
+A response has the "id" of its request, the time the server spent on the
+request in "latency_ms", and either "results" (a list of [value, weight]
+pairs, where melodies are given by their name), "stats", "ok" (for a
+remove), or an "error" message.
+
+Autocomplete requests arriving within a short window of each other, on any
+connection, are answered by a single batch_autocomplete call for each limit.
+At most max_pending requests wait for a batch; once there are that many,
+the server stops reading from its connections until a batch is answered.
+
+Run from the a2 folder:
+    python autocomplete_server.py --engine letter --file data/lotr.txt \\
+        --port 8148
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import json
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from autocomplete_engines import LetterAutocompleteEngine, \
+    SentenceAutocompleteEngine, MelodyAutocompleteEngine
+
+ENGINES = {
+    'letter': LetterAutocompleteEngine,
+    'sentence': SentenceAutocompleteEngine,
+    'melody': MelodyAutocompleteEngine
+}
+# the number of recent latencies kept for the stats request
+LATENCY_WINDOW = 10000
+# the largest max_distance of a fuzzy_autocomplete request
+MAX_DISTANCE = 2
+
+
+class AutocompleteServer:
+    """A server answering the requests of its clients with one engine.
+
+    === Attributes ===
+    engine:
+        The autocomplete engine that answers the requests.
+    batch_window:
+        How long, in seconds, the first autocomplete request of a batch waits
+        for others to join it.
+    requests:
+        The number of requests answered so far.
+    batches:
+        The number of batch_autocomplete calls made so far.
+    _max_pending:
+        The largest number of autocomplete requests waiting for a batch.
+    _pending:
+        The autocomplete requests waiting for a batch, as (prefix, limit,
+        future of the results) tuples, or None until the server starts.
+    _batcher:
+        The task answering the pending requests, or None until the server
+        starts.
+    _latencies:
+        The latencies of the most recent requests, in seconds.
+    """
+    engine: Any
+    batch_window: float
+    requests: int
+    batches: int
+    _max_pending: int
+    _pending: Optional[asyncio.Queue]
+    _batcher: Optional[asyncio.Task]
+    _latencies: List[float]
+
+    def __init__(self, engine: Any, batch_window: float = 0.002,
+                 max_pending: int = 1024) -> None:
+        """Initialize a server for <engine>, batching the autocomplete
+        requests that arrive within <batch_window> seconds of each other,
+        and holding at most <max_pending> of them at once.
+
+        Precondition: batch_window >= 0 and max_pending > 0
+        """
+        self.engine = engine
+        self.batch_window = batch_window
+        self.requests = 0
+        self.batches = 0
+        self._max_pending = max_pending
+        self._pending = None
+        self._batcher = None
+        self._latencies = []
+
+    async def start(self, host: Optional[str] = '127.0.0.1',
+                    port: int = 0,
+                    path: Optional[str] = None) -> asyncio.AbstractServer:
+        """Start serving on the Unix socket <path>, or on <host> and <port>
+        if <path> is None, and return the asyncio server.
+
+        Port 0 picks any free port; the chosen one is given by the sockets
+        of the returned server.
+        """
+        self._pending = asyncio.Queue(self._max_pending)
+        self._batcher = asyncio.get_running_loop().create_task(
+            self._batch_forever())
+        if path is not None:
+            return await asyncio.start_unix_server(self._serve_client, path)
+        return await asyncio.start_server(self._serve_client, host, port)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return the number of requests and batches so far, and percentiles
+        of the most recent request latencies in milliseconds.
+        """
+        result = {'requests': self.requests, 'batches': self.batches}
+        ordered = sorted(self._latencies)
+        for percentile in [50, 90, 99]:
+            if ordered:
+                rank = max(1, -(-percentile * len(ordered) // 100))
+                result[f'p{percentile}_ms'] = ordered[rank - 1] * 1000
+        return result
+
+    async def _serve_client(self, reader: asyncio.StreamReader,
+                            writer: asyncio.StreamWriter) -> None:
+        """Answer the requests of one client until it closes its connection.
+        """
+        replies = set()
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            # waits here while the server is saturated, so that this client's
+            # later requests stay unread
+            reply = await self._answer_later(line, writer)
+            replies.add(reply)
+            reply.add_done_callback(replies.discard)
+        if replies:
+            await asyncio.wait(replies)
+        writer.close()
+
+    async def _answer_later(self, line: bytes,
+                            writer: asyncio.StreamWriter) -> asyncio.Task:
+        """Start answering the request <line>, and return the task that
+        writes its response to <writer>.
+        """
+        start = time.perf_counter()
+        results = asyncio.get_running_loop().create_future()
+        request = {}
+        try:
+            request = json.loads(line)
+            if request['op'] == 'autocomplete':
+                # checked here, so that a bad request cannot fail the other
+                # requests of its batch
+                prefix = self._prefix(request['prefix'])
+                limit = _limit(request.get('limit'))
+                await self._pending.put((prefix, limit, results))
+            else:
+                results.set_result(self._answer(request))
+        except Exception as error:
+            results.set_exception(error)
+        return asyncio.get_running_loop().create_task(
+            self._respond(request, start, results, writer))
+
+    def _answer(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """Return the response fields of a request that is not batched."""
+        if request['op'] == 'fuzzy_autocomplete':
+            return {'results': self.engine.fuzzy_autocomplete(
+                self._prefix(request['prefix']),
+                _max_distance(request.get('max_distance', 1)),
+                _limit(request.get('limit')))}
+        elif request['op'] == 'remove':
+            self.engine.remove(self._prefix(request['prefix']))
+            return {'ok': True}
+        elif request['op'] == 'stats':
+            return {'stats': self.stats()}
+        raise ValueError(f"unknown op {request['op']!r}")
+
+    def _prefix(self, prefix: Any) -> Any:
+        """Return the prefix given in a request as the engine expects it.
+
+        Raise a TypeError if <prefix> is not a string, or a list of
+        intervals for the melody engine.
+        """
+        if not isinstance(self.engine, MelodyAutocompleteEngine):
+            if not isinstance(prefix, str):
+                raise TypeError(f'prefix must be a string, not {prefix!r}')
+            return prefix
+        if not isinstance(prefix, list) or \
+                not all(_is_int(interval) for interval in prefix):
+            raise TypeError(f'prefix must be a list of intervals, '
+                            f'not {prefix!r}')
+        return prefix
+
+    async def _respond(self, request: Dict[str, Any], start: float,
+                       results: asyncio.Future,
+                       writer: asyncio.StreamWriter) -> None:
+        """Write the response to <request>, received at time <start>, once
+        <results> is done.
+        """
+        try:
+            response = await results
+        except Exception as error:
+            response = {'error': f'{type(error).__name__}: {error}'}
+        if 'results' in response:
+            response['results'] = [[_jsonable(value), weight]
+                                   for value, weight in response['results']]
+        latency = time.perf_counter() - start
+        self.requests += 1
+        self._latencies.append(latency)
+        if len(self._latencies) > 2 * LATENCY_WINDOW:
+            del self._latencies[:-LATENCY_WINDOW]
+        response['id'] = request.get('id') if isinstance(request, dict) \
+            else None
+        response['latency_ms'] = latency * 1000
+        writer.write(json.dumps(response).encode() + b'\n')
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+
+    async def _batch_forever(self) -> None:
+        """Answer the pending autocomplete requests in batches, forever."""
+        while True:
+            batch = [await self._pending.get()]
+            await asyncio.sleep(self.batch_window)
+            while not self._pending.empty():
+                batch.append(self._pending.get_nowait())
+            try:
+                self._answer_batch(batch)
+            except Exception as error:
+                # the batcher must survive, or every later request hangs
+                for _, _, results in batch:
+                    if not results.done():
+                        results.set_exception(error)
+
+    def _answer_batch(self, batch: List[Tuple[Any, Optional[int],
+                                              asyncio.Future]]) -> None:
+        """Answer the autocomplete requests in <batch>, with one
+        batch_autocomplete call for each of their limits.
+        """
+        by_limit = {}
+        for request in batch:
+            by_limit.setdefault(request[1], []).append(request)
+        for limit, requests in by_limit.items():
+            self.batches += 1
+            try:
+                all_results = self.engine.batch_autocomplete(
+                    [prefix for prefix, _, _ in requests], limit)
+            except Exception as error:
+                for _, _, results in requests:
+                    results.set_exception(error)
+                continue
+            for (_, _, results), matches in zip(requests, all_results):
+                results.set_result({'results': matches})
+
+
+def _limit(limit: Any) -> Optional[int]:
+    """Return the limit given in a request.
+
+    Raise a ValueError if <limit> is neither None nor a positive int.
+    """
+    if limit is not None and not (_is_int(limit) and limit > 0):
+        raise ValueError(f'limit must be a positive integer, not {limit!r}')
+    return limit
+
+
+def _max_distance(max_distance: Any) -> int:
+    """Return the max_distance given in a request.
+
+    Raise a ValueError if <max_distance> is not an int from 0 to
+    MAX_DISTANCE: the search keeps a list for every distance, and larger
+    distances match most of the tree.
+    """
+    if not (_is_int(max_distance) and 0 <= max_distance <= MAX_DISTANCE):
+        raise ValueError(f'max_distance must be an integer from 0 to '
+                         f'{MAX_DISTANCE}, not {max_distance!r}')
+    return max_distance
+
+
+def _is_int(value: Any) -> bool:
+    """Return whether <value> is an int given in a request."""
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def _jsonable(value: Any) -> Any:
+    """Return <value>, or its name if it is a melody."""
+    return value if isinstance(value, str) else value.name
+
+
+def main(args: Optional[List[str]] = None) -> None:
+    """Run a server with the command line arguments <args>."""
+    parser = argparse.ArgumentParser(
+        description='Serve an autocomplete engine on a local socket.')
+    parser.add_argument('--engine', choices=sorted(ENGINES), required=True)
+    parser.add_argument('--file', required=True, help='the data file')
+    parser.add_argument('--autocompleter', default='compressed',
+                        choices=['simple', 'compressed'])
+    parser.add_argument('--weight-type', default='sum',
+                        choices=['sum', 'average'])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8148)
+    parser.add_argument('--unix', help='serve on this Unix socket instead')
+    parser.add_argument('--window', type=float, default=0.002,
+                        help='batching window in seconds')
+    parser.add_argument('--max-pending', type=int, default=1024,
+                        help='autocomplete requests waiting at most')
+    options = parser.parse_args(args)
+
+    engine = ENGINES[options.engine]({
+        'file': options.file,
+        'autocompleter': options.autocompleter,
+        'weight_type': options.weight_type
+    })
+    server = AutocompleteServer(engine, options.window, options.max_pending)
+
+    async def serve() -> None:
+        """Serve until interrupted."""
+        asyncio_server = await server.start(options.host, options.port,
+                                            options.unix)
+        async with asyncio_server:
+            await asyncio_server.serve_forever()
+
+    asyncio.run(serve())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+import asyncio
+import json
+import unittest
+from autocomplete_engines import SentenceAutocompleteEngine
+from autocomplete_server import *
+
+
+class AutocompleteServerTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.engine = SentenceAutocompleteEngine({
+            'file': 'data/google_searches.csv',
+            'autocompleter': 'compressed', 'weight_type': 'sum'})
+        self.server = AutocompleteServer(self.engine, batch_window=0.01)
+        self.asyncio_server = await self.server.start()
+        self.port = self.asyncio_server.sockets[0].getsockname()[1]
+
+    async def asyncTearDown(self):
+        self.asyncio_server.close()
+        await self.asyncio_server.wait_closed()
+
+    async def ask(self, requests):
+        reader, writer = await asyncio.open_connection('127.0.0.1',
+                                                       self.port)
+        for request in requests:
+            writer.write(json.dumps(request).encode() + b'\n')
+        await writer.drain()
+        responses = [json.loads(await reader.readline())
+                     for _ in requests]
+        writer.close()
+        await writer.wait_closed()
+        return {response['id']: response for response in responses}
+
+    async def test_concurrent_requests_are_batched(self):
+        prefixes = ['how', 'what', 'how to', 'why', 'zzz', '']
+        clients = [self.ask([{'id': i, 'op': 'autocomplete',
+                              'prefix': prefix, 'limit': 3}
+                             for i, prefix in enumerate(prefixes)])
+                   for _ in range(3)]
+        for responses in await asyncio.gather(*clients):
+            for i, prefix in enumerate(prefixes):
+                expected = [list(match) for match in
+                            self.engine.autocomplete(prefix, 3)]
+                self.assertEqual(responses[i]['results'], expected)
+                self.assertGreaterEqual(responses[i]['latency_ms'], 0)
+        self.assertEqual(self.server.requests, 18)
+        self.assertLess(self.server.batches, 18)
+
+    async def test_other_operations(self):
+        responses = await self.ask([
+            {'id': 'fuzzy', 'op': 'fuzzy_autocomplete', 'prefix': 'hwo to',
+             'limit': 2},
+            {'id': 'bad', 'op': 'explode'},
+            {'id': 'stats', 'op': 'stats'}])
+        self.assertEqual(responses['fuzzy']['results'],
+                         [list(match) for match in
+                          self.engine.fuzzy_autocomplete('hwo to', 1, 2)])
+        self.assertIn('error', responses['bad'])
+        self.assertIn('requests', responses['stats']['stats'])
+        responses = await self.ask([{'id': 0, 'op': 'remove',
+                                     'prefix': 'how'}])
+        self.assertTrue(responses[0]['ok'])
+        self.assertEqual(self.engine.autocomplete('how'), [])
+
+    async def test_fuzzy_max_distance_is_capped(self):
+        responses = await self.ask([
+            {'id': 'huge', 'op': 'fuzzy_autocomplete', 'prefix': 'how',
+             'max_distance': 100000000},
+            {'id': 'negative', 'op': 'fuzzy_autocomplete', 'prefix': 'how',
+             'max_distance': -1},
+            {'id': 'text', 'op': 'fuzzy_autocomplete', 'prefix': 'how',
+             'max_distance': '1'},
+            {'id': 'capped', 'op': 'fuzzy_autocomplete', 'prefix': 'hwo',
+             'max_distance': MAX_DISTANCE, 'limit': 2}])
+        for bad in ['huge', 'negative', 'text']:
+            self.assertIn('max_distance', responses[bad]['error'])
+        self.assertEqual(responses['capped']['results'],
+                         [list(match) for match in
+                          self.engine.fuzzy_autocomplete('hwo', MAX_DISTANCE,
+                                                         2)])
+
+    async def test_bad_requests_fail_alone(self):
+        responses = await self.ask([
+            {'id': 'list limit', 'op': 'autocomplete', 'prefix': 'how',
+             'limit': [1]},
+            {'id': 'zero limit', 'op': 'autocomplete', 'prefix': 'how',
+             'limit': 0},
+            {'id': 'list prefix', 'op': 'autocomplete', 'prefix': ['a', 1],
+             'limit': 3},
+            {'id': 'good', 'op': 'autocomplete', 'prefix': 'how',
+             'limit': 3}])
+        for bad in ['list limit', 'zero limit', 'list prefix']:
+            self.assertIn('error', responses[bad])
+        self.assertEqual(responses['good']['results'],
+                         [list(match) for match in
+                          self.engine.autocomplete('how', 3)])
+        # the batcher is still answering
+        responses = await self.ask([{'id': 0, 'op': 'autocomplete',
+                                     'prefix': 'what', 'limit': 2}])
+        self.assertEqual(len(responses[0]['results']), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,266 @@
+"""CSC148 Assignment 2: Autocomplete engine benchmarks
+
+=== Module description ===
+This file measures the autocomplete engines on every file in the data
+folder, with both kinds of prefix tree and both weight types. For each
+combination it reports the build time, the peak memory used while building
+(measured with tracemalloc), the number of tree nodes, and latency
+percentiles of autocomplete and remove calls.
+
+The queries are drawn from the prefixes stored in the tree with a seeded
+random generator, so two runs with the same seed send exactly the same
+queries. The results are written as JSON, and an older result file can be
+passed with --compare to print how every measurement changed.
+
+Run from the a2 folder:
+    python benchmark.py --output results.json
+    python benchmark.py --compare results.json
+"""
+from __future__ import annotations
+import argparse
+import csv
+import json
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from autocomplete_engines import LetterAutocompleteEngine, \
+    SentenceAutocompleteEngine, MelodyAutocompleteEngine
+
+DATA_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+AUTOCOMPLETERS = ['simple', 'compressed']
+WEIGHT_TYPES = ['sum', 'average']
+# the limits of the autocomplete queries; most queries show a short page
+LIMITS = [1, 5, 10, 10, 10, 10, None]
+PERCENTILES = [50, 90, 99]
+
+# how a prefix list of each engine is written in a query to the engine
+QUERY_FORMATS = {
+    LetterAutocompleteEngine: ''.join,
+    SentenceAutocompleteEngine: ' '.join,
+    MelodyAutocompleteEngine: list
+}
+
+
+def engine_class_for(path: str) -> type:
+    """Return the engine class that reads the data file <path>.
+
+    Text files hold letter data. CSV files hold melodies if their rows have
+    more than two entries, and sentences otherwise.
+    """
+    if path.endswith('.txt'):
+        return LetterAutocompleteEngine
+    with open(path) as csvfile:
+        first_row = next(csv.reader(csvfile), [])
+    if len(first_row) > 2:
+        return MelodyAutocompleteEngine
+    return SentenceAutocompleteEngine
+
+
+def count_nodes(tree: Any) -> int:
+    """Return the number of trees (including leaves) in the prefix tree
+    <tree>.
+    """
+    count = 0
+    stack = [tree]
+    while stack:
+        subtree = stack.pop()
+        count += 1
+        stack.extend(subtree.subtrees)
+    return count
+
+
+def stored_prefixes(tree: Any) -> List[List]:
+    """Return the prefix of every value stored in the prefix tree <tree>,
+    in sorted order.
+
+    The result does not depend on the kind of prefix tree, so both kinds are
+    queried with the same prefixes.
+    """
+    prefixes = []
+    stack = [tree]
+    while stack:
+        subtree = stack.pop()
+        for child in subtree.subtrees:
+            if child.is_leaf():
+                prefixes.append(subtree.value)
+            else:
+                stack.append(child)
+    prefixes.sort()
+    return prefixes
+
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    """Return the PERCENTILES and the maximum of <samples>, using the
+    nearest-rank method.
+    """
+    ordered = sorted(samples)
+    result = {}
+    for percentile in PERCENTILES:
+        rank = max(1, -(-percentile * len(ordered) // 100))
+        result[f'p{percentile}'] = ordered[rank - 1]
+    result['max'] = ordered[-1]
+    return result
+
+
+def timed(function: Callable, *args: Any) -> float:
+    """Call <function> with <args> and return how long it took, in seconds.
+    """
+    start = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - start
+
+
+def benchmark_file(path: str, autocompleter: str, weight_type: str,
+                   queries: int = 1000, removes: int = 200,
+                   seed: int = 148,
+                   measure_memory: bool = True) -> Dict[str, Any]:
+    """Return the measurements of the engine built from the data file <path>
+    with the given kind of prefix tree and weight type.
+
+    <queries> autocomplete calls are timed, then <removes> remove calls, on
+    prefixes chosen with a random generator seeded with <seed>. If
+    <measure_memory> is True, the engine is built a second time with
+    tracemalloc running, so that tracing does not slow down the timed build.
+    """
+    engine_class = engine_class_for(path)
+    config = {'file': path, 'autocompleter': autocompleter,
+              'weight_type': weight_type}
+    start = time.perf_counter()
+    engine = engine_class(config)
+    build_seconds = time.perf_counter() - start
+    result = {
+        'engine': engine_class.__name__,
+        'file': os.path.basename(path),
+        'autocompleter': autocompleter,
+        'weight_type': weight_type,
+        'build_seconds': build_seconds,
+        'nodes': count_nodes(engine.autocompleter),
+        'values': len(engine.autocompleter)
+    }
+
+    rng = random.Random(seed)
+    prefixes = stored_prefixes(engine.autocompleter)
+    to_query = QUERY_FORMATS[engine_class]
+    latencies = []
+    for _ in range(queries if prefixes else 0):
+        prefix = rng.choice(prefixes)
+        prefix = to_query(prefix[:rng.randint(0, len(prefix))])
+        latencies.append(timed(engine.autocomplete, prefix,
+                               rng.choice(LIMITS)))
+    result['autocomplete_seconds'] = percentiles(latencies) if latencies \
+        else None
+    # whole stored prefixes, so that each call removes a few values only
+    latencies = [timed(engine.remove, to_query(prefix))
+                 for prefix in rng.sample(prefixes, min(removes,
+                                                        len(prefixes)))]
+    result['remove_seconds'] = percentiles(latencies) if latencies else None
+
+    result['peak_memory_bytes'] = None
+    if measure_memory:
+        del engine
+        tracemalloc.start()
+        engine_class(config)
+        result['peak_memory_bytes'] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return result
+
+
+def run(data_folder: str = DATA_FOLDER, queries: int = 1000,
+        removes: int = 200, seed: int = 148,
+        measure_memory: bool = True) -> Dict[str, Any]:
+    """Return the measurements of every engine that can be built from the
+    files in <data_folder>, together with a description of this machine.
+
+    See benchmark_file for the other arguments.
+    """
+    results = []
+    for name in sorted(os.listdir(data_folder)):
+        if not name.endswith(('.txt', '.csv')):
+            continue
+        for autocompleter in AUTOCOMPLETERS:
+            for weight_type in WEIGHT_TYPES:
+                results.append(benchmark_file(
+                    os.path.join(data_folder, name), autocompleter,
+                    weight_type, queries, removes, seed, measure_memory))
+    return {
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'seed': seed,
+        'queries': queries,
+        'removes': removes,
+        'results': results
+    }
+
+
+def _key(result: Dict[str, Any]) -> Tuple[str, str, str, str]:
+    """Return what identifies the engine measured in <result>."""
+    return (result['engine'], result['file'], result['autocompleter'],
+            result['weight_type'])
+
+
+def compare(old: Dict[str, Any], new: Dict[str, Any]) -> List[str]:
+    """Return one line for each engine measured in both <old> and <new>,
+    giving the ratio new / old of its build time, peak memory, node count
+    and median latencies.
+    """
+    measures = [('build', lambda r: r['build_seconds']),
+                ('memory', lambda r: r['peak_memory_bytes']),
+                ('nodes', lambda r: r['nodes']),
+                ('autocomplete p50',
+                 lambda r: (r['autocomplete_seconds'] or {}).get('p50')),
+                ('remove p50',
+                 lambda r: (r['remove_seconds'] or {}).get('p50'))]
+    old_results = {_key(result): result for result in old['results']}
+    lines = []
+    for result in new['results']:
+        if _key(result) not in old_results:
+            continue
+        ratios = []
+        for name, measure in measures:
+            before = measure(old_results[_key(result)])
+            after = measure(result)
+            if before and after is not None:
+                ratios.append(f'{name} x{after / before:.2f}')
+        lines.append(' '.join(_key(result)) + ': ' + ', '.join(ratios))
+    return lines
+
+
+def main(args: Optional[List[str]] = None) -> None:
+    """Run the benchmarks with the command line arguments <args>."""
+    parser = argparse.ArgumentParser(
+        description='Benchmark the autocomplete engines.')
+    parser.add_argument('--data', default=DATA_FOLDER,
+                        help='folder of data files (default: a2/data)')
+    parser.add_argument('--queries', type=int, default=1000,
+                        help='autocomplete calls per engine')
+    parser.add_argument('--removes', type=int, default=200,
+                        help='remove calls per engine')
+    parser.add_argument('--seed', type=int, default=148,
+                        help='seed of the query generator')
+    parser.add_argument('--no-memory', action='store_true',
+                        help='skip the tracemalloc build')
+    parser.add_argument('--output', help='write the JSON results here')
+    parser.add_argument('--compare', help='JSON results of an earlier run')
+    options = parser.parse_args(args)
+
+    results = run(options.data, options.queries, options.removes,
+                  options.seed, not options.no_memory)
+    if options.output:
+        with open(options.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    elif not options.compare:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+    if options.compare:
+        with open(options.compare) as f:
+            print('\n'.join(compare(json.load(f), results)))
+
+
+if __name__ == '__main__':
+    main()
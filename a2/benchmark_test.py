@@ -0,0 +1,39 @@
+import os
+import unittest
+from benchmark import *
+
+
+class BenchmarkTest(unittest.TestCase):
+
+    def test_percentiles(self):
+        samples = [float(i) for i in range(1, 101)]
+        expected = {'p50': 50.0, 'p90': 90.0, 'p99': 99.0, 'max': 100.0}
+        self.assertEqual(percentiles(samples), expected)
+
+    def test_engine_class_for_data_files(self):
+        self.assertIs(engine_class_for(os.path.join(DATA_FOLDER, 'lotr.txt')),
+                      LetterAutocompleteEngine)
+        self.assertIs(engine_class_for(
+            os.path.join(DATA_FOLDER, 'google_searches.csv')),
+            SentenceAutocompleteEngine)
+        self.assertIs(engine_class_for(
+            os.path.join(DATA_FOLDER, 'songbook.csv')),
+            MelodyAutocompleteEngine)
+
+    def test_benchmark_file(self):
+        path = os.path.join(DATA_FOLDER, 'sample_sentences.csv')
+        results = [benchmark_file(path, autocompleter, 'sum', queries=20,
+                                  removes=2)
+                   for autocompleter in AUTOCOMPLETERS]
+        for result in results:
+            self.assertEqual(result['values'], 3)
+            self.assertGreater(result['peak_memory_bytes'], 0)
+            self.assertEqual(set(result['autocomplete_seconds']),
+                             {'p50', 'p90', 'p99', 'max'})
+        self.assertEqual([result['nodes'] for result in results], [15, 7])
+        self.assertEqual(len(compare({'results': results},
+                                     {'results': results})), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
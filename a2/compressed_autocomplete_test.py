@@ -120,6 +120,58 @@ class CompressedAutoCompleteTest(unittest.TestCase):
         expected = [('car', 100.0), ('care', 30.0), ('cat', 20.0)]
         self.assertEqual(tree.autocomplete(['c'], 4), expected)
 
+    def test_limit_returns_heaviest_leaves(self):
+        self.sum_tree.insert('Alice', 5, ['a', 'c'])
+        self.sum_tree.insert('Jacky', 6, ['a', 'd'])
+        self.sum_tree.insert('Bob', 9, ['b'])
+        expected = [('Bob', 9.0), ('Jacky', 6.0)]
+        self.assertEqual(self.sum_tree.autocomplete([], 2), expected)
+
+    def test_iter_matches_in_weight_order(self):
+        self.sum_tree.insert('Alice', 5, ['a', 'c'])
+        self.sum_tree.insert('Jacky', 6, ['a', 'd'])
+        self.sum_tree.insert('Bob', 9, ['b'])
+        matches = self.sum_tree.iter_autocomplete([])
+        self.assertEqual(next(matches), ('Bob', 9.0))
+        self.assertEqual(list(matches), [('Jacky', 6.0), ('Alice', 5.0)])
+
+    def test_iter_missing_prefix(self):
+        self.sum_tree.insert('Alice', 5, ['a', 'c'])
+        self.assertEqual(list(self.sum_tree.iter_autocomplete(['b'])), [])
+
+    def test_batch_matches_single_calls(self):
+        self.sum_tree.insert('Alice', 5, ['a', 'c'])
+        self.sum_tree.insert('Jacky', 6, ['a', 'd'])
+        self.sum_tree.insert('Bob', 9, ['b'])
+        prefixes = [['a', 'd'], ['b'], [], ['a'], ['a', 'e'], ['a']]
+        expected = [self.sum_tree.autocomplete(prefix, 2)
+                    for prefix in prefixes]
+        self.assertEqual(self.sum_tree.batch_autocomplete(prefixes, 2),
+                         expected)
+
+    def test_fuzzy_ranks_by_distance_then_weight(self):
+        self.sum_tree.insert('cart', 3, ['c', 'a', 'r', 't'])
+        self.sum_tree.insert('cat', 2, ['c', 'a', 't'])
+        self.sum_tree.insert('dog', 4, ['d', 'o', 'g'])
+        self.sum_tree.insert('cut', 9, ['c', 'u', 't'])
+        expected = [('cat', 2.0), ('cut', 9.0), ('cart', 3.0)]
+        self.assertEqual(self.sum_tree.fuzzy_autocomplete(['c', 'a', 't']),
+                         expected)
+        self.assertEqual(self.sum_tree.fuzzy_autocomplete(['c', 'a', 't'],
+                                                          0), expected[:1])
+        self.assertEqual(self.sum_tree.fuzzy_autocomplete(['x', 'o'], 1, 1),
+                         [('dog', 4.0)])
+        self.assertEqual(self.sum_tree.fuzzy_autocomplete(['x', 'y'], 1), [])
+
+    def test_fuzzy_short_query_on_compressed_root(self):
+        # the root's value is ['a', 'b'], not the empty prefix
+        self.sum_tree.insert('ab', 1, ['a', 'b'])
+        self.assertEqual(self.sum_tree.fuzzy_autocomplete([], 0),
+                         [('ab', 1.0)])
+        self.assertEqual(self.sum_tree.fuzzy_autocomplete(['x'], 1),
+                         [('ab', 1.0)])
+        self.assertEqual(self.sum_tree.fuzzy_autocomplete(['x', 'y'], 1), [])
+
 
 if __name__ == '__main__':
     unittest.main()
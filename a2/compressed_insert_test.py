@@ -1,3 +1,5 @@
+import os
+import tempfile
 import unittest
 from prefix_tree import *
 
@@ -65,10 +67,64 @@ class TestInsert(unittest.TestCase):
                    "[Tree(danger (6.0))]), Tree(['d', 'o', 'o', 'r'] (4.0) [Tree(door (4.0))])])])"
         self.assertEqual(expected, repr_tree(tree))
 
+    def test_insert_splits_edges_in_place(self):
+        tree = CompressedPrefixTree('sum')
+        tree.insert('abcd', 1.0, ['a', 'b', 'c', 'd'])
+        tree.insert('abce', 2.0, ['a', 'b', 'c', 'e'])
+        tree.insert('abx', 3.0, ['a', 'b', 'x'])
+        tree.insert('q', 4.0, ['q'])
+        expected = "Tree([] (10.0) [Tree(['a', 'b'] (6.0) [Tree(['a', 'b', 'c'] (3.0) " \
+                   "[Tree(['a', 'b', 'c', 'e'] (2.0) [Tree(abce (2.0))]), " \
+                   "Tree(['a', 'b', 'c', 'd'] (1.0) [Tree(abcd (1.0))])]), " \
+                   "Tree(['a', 'b', 'x'] (3.0) [Tree(abx (3.0))])]), " \
+                   "Tree(['q'] (4.0) [Tree(q (4.0))])])"
+        self.assertEqual(expected, repr_tree(tree))
+        self.assertEqual(tree.autocomplete(['a', 'b', 'c']),
+                         [('abce', 2.0), ('abcd', 1.0)])
 
+    def test_weight_of_repeated_value(self):
+        tree = CompressedPrefixTree('average')
+        tree.insert('car', 100.0, ['c', 'a', 'r'])
+        tree.insert('cat', 20.0, ['c', 'a', 't'])
+        tree.insert('car', 50.0, ['c', 'a', 'r'])
+        self.assertEqual(tree.weight_of('car'), 150.0)
+        self.assertEqual(tree.weight, 85.0)
 
+    def test_bulk_load_sample_on_handout(self):
+        tree = CompressedPrefixTree('average')
+        tree.bulk_load([('car', 100.0, ['c', 'a', 'r']),
+                        ('door', 4.0, ['d', 'o', 'o', 'r']),
+                        ('danger', 6.0, ['d', 'a', 'n', 'g', 'e', 'r']),
+                        ('cat', 20.0, ['c', 'a', 't']),
+                        ('care', 30.0, ['c', 'a', 'r', 'e'])])
+        expected = "Tree([] (32.0) [Tree(['c', 'a'] (50.0) [Tree(['c', 'a', 'r'] (65.0) [Tree(car (100.0))," \
+                   " Tree(['c', 'a', 'r', 'e'] (30.0) [Tree(care (30.0))])]), Tree(['c', 'a', 't'] (20.0) " \
+                   "[Tree(cat (20.0))])]), Tree(['d'] (5.0) [Tree(['d', 'a', 'n', 'g', 'e', 'r'] (6.0) " \
+                   "[Tree(danger (6.0))]), Tree(['d', 'o', 'o', 'r'] (4.0) [Tree(door (4.0))])])])"
+        self.assertEqual(expected, repr_tree(tree))
 
+    def test_bulk_load_shared_root_prefix(self):
+        tree = CompressedPrefixTree('sum')
+        tree.bulk_load([('Alice', 2.0, ['a', 'b']), ('Bob', 5.0, ['a', 'c'])])
+        expected = "Tree(['a'] (7.0) [Tree(['a', 'c'] (5.0) [Tree(Bob (5.0))]), " \
+                   "Tree(['a', 'b'] (2.0) [Tree(Alice (2.0))])])"
+        self.assertEqual(expected, repr_tree(tree))
 
+    def test_save_and_load_snapshot(self):
+        tree = CompressedPrefixTree('average')
+        tree.insert('car', 100.0, ['c', 'a', 'r'])
+        tree.insert('cat', 20.0, ['c', 'a', 't'])
+        tree.insert('care', 30.0, ['c', 'a', 'r', 'e'])
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, 'tree.snapshot')
+            tree.save(path)
+            loaded = CompressedPrefixTree.load(path)
+            with self.assertRaises(ValueError):
+                SimplePrefixTree.load(path)
+        self.assertEqual(repr_tree(tree), repr_tree(loaded))
+        self.assertEqual(len(loaded), 3)
+        self.assertEqual(loaded.autocomplete(['c', 'a', 'r'], 1),
+                         [('car', 100.0)])
 
 
 if __name__ == "__main__":
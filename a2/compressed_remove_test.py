@@ -73,6 +73,14 @@ class TestInsert(unittest.TestCase):
         expected = "Tree(['a', 'b'] (2.0) [Tree(Hello (2.0))])"
         self.assertEqual(expected, repr_tree(tree))
 
+    def test_removed_values_have_no_weight(self):
+        tree = CompressedPrefixTree('sum')
+        tree.insert('Hello', 2.0, ['a', 'b'])
+        tree.insert('Hey', 2.0, ['a', 'b', 'c', 'q'])
+        tree.remove(['a', 'b', 'c'])
+        self.assertEqual(tree.weight_of('Hey'), 0.0)
+        self.assertEqual(tree.weight_of('Hello'), 2.0)
+
 
 if __name__ == "__main__":
     unittest.main(exit=False)
\ No newline at end of file
@@ -0,0 +1,65 @@
+import unittest
+from prefix_tree import *
+
+
+class DecayingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 0.0
+        self.trees = [
+            DecayingPrefixTree(SimplePrefixTree('sum'), 10.0, self.clock),
+            DecayingPrefixTree(CompressedPrefixTree('average', 2), 10.0,
+                               self.clock)]
+
+    def clock(self):
+        return self.now
+
+    def test_old_weights_decay(self):
+        for tree in self.trees:
+            tree.insert('car', 8.0, ['c', 'a', 'r'])
+            self.now += 10.0
+            self.assertEqual(tree.weight_of('car'), 4.0)
+            tree.insert('cat', 5.0, ['c', 'a', 't'])
+            self.assertEqual(tree.autocomplete(['c']),
+                             [('cat', 5.0), ('car', 4.0)])
+            self.now += 20.0
+            self.assertEqual(tree.autocomplete(['c'], 1), [('cat', 1.25)])
+            self.assertEqual(list(tree.iter_autocomplete(['c', 'a', 'r'])),
+                             [('car', 1.0)])
+
+    def test_repeated_value_mixes_insert_times(self):
+        for tree in self.trees:
+            tree.insert('car', 2.0, ['c', 'a', 'r'])
+            self.now += 10.0
+            tree.insert('car', 3.0, ['c', 'a', 'r'])
+            self.assertEqual(tree.weight_of('car'), 4.0)
+            self.now = 0.0
+
+    def test_renormalise_keeps_weights_and_order(self):
+        for tree in self.trees:
+            tree.insert('car', 8.0, ['c', 'a', 'r'])
+            tree.insert('cab', 1.0, ['c', 'a', 'b'])
+            self.now += 700.0
+            tree.insert('cat', 2.0 ** -60, ['c', 'a', 't'])
+            self.assertEqual(tree._epoch, self.now)
+            self.assertEqual(tree.autocomplete([], 2),
+                             [('cat', 2.0 ** -60), ('car', 2.0 ** -67)])
+            self.assertEqual(tree.autocomplete(['c', 'a'], 1),
+                             [('cat', 2.0 ** -60)])
+            self.now = 0.0
+
+    def test_remove_keeps_much_older_weights(self):
+        for tree in self.trees:
+            tree.half_life = 1.0
+            tree.insert('old', 1.0, ['a', 'x'])
+            self.now += 60.0
+            tree.insert('new', 1.0, ['a', 'y'])
+            tree.remove(['a', 'y'])
+            self.assertEqual(len(tree), 1)
+            self.assertEqual(tree.autocomplete(['a']), [('old', 2.0 ** -60)])
+            self.assertEqual(tree.weight_of('old'), 2.0 ** -60)
+            self.now = 0.0
+
+
+if __name__ == '__main__':
+    unittest.main()
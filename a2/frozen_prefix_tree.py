@@ -0,0 +1,427 @@
+"""CSC148 Assignment 2: Frozen prefix trees
+
+=== Module description ===
+This file contains FrozenPrefixTree, a read-only copy of a SimplePrefixTree
+or CompressedPrefixTree that is much smaller than the tree it copies. It is
+made by the freeze method of those classes.
+
+Instead of one Python object per tree, a frozen prefix tree stores a few
+NumPy arrays:
+    - the shape of the tree as a LOUDS bit vector (level-order unary degree
+      sequence): every non-leaf tree, in level order, is written as one 1
+      bit for each of its non-leaf subtrees followed by a 0 bit. The
+      subtrees of a tree are then found by rank and select queries on the
+      bits, which use a small directory of counts per block of bits.
+    - the prefix elements of every edge, as ids into a pooled table of the
+      distinct prefix elements.
+    - the values in depth-first order, so that the values stored in any
+      tree form a range of them, with their weights and the range and
+      largest leaf weight of every tree. Strings are pooled as one block of
+      UTF-8 text.
+"""
+from __future__ import annotations
+import heapq
+import itertools
+import sys
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from prefix_tree import Autocompleter
+
+# The number of bits summarised by each entry of the rank directory.
+_BLOCK_BITS = 512
+_BLOCK_BYTES = _BLOCK_BITS // 8
+
+
+class FrozenPrefixTree(Autocompleter):
+    """A read-only prefix tree stored in flat arrays.
+
+    Trees are numbered in level order, so the root is tree 0 and the
+    subtrees of each tree have consecutive numbers, in increasing order of
+    the id of their first edge element. Only non-leaf trees are numbered;
+    the values stored at leaves are numbered separately, in depth-first
+    order, with the values of a tree's own leaves before those of its
+    subtrees.
+
+    === Attributes ===
+    _louds:
+        The LOUDS bits of the trees, packed into bytes, after the bits 10
+        of a virtual parent of the root.
+    _ones_before:
+        The number of 1 bits before each block of _BLOCK_BITS bits.
+    _zeros_before:
+        The number of 0 bits before each block of _BLOCK_BITS bits.
+    _edge_starts:
+        The edge of tree i is _edge_elements[_edge_starts[i]:
+        _edge_starts[i + 1]]: the ids of the prefix elements that its value
+        adds to the value of its parent (all of its value, for the root).
+    _edge_elements:
+        The ids of the prefix elements of every edge.
+    _element_ids:
+        The id of every distinct prefix element.
+    _leaf_starts, _leaf_ends:
+        The values stored in tree i are the values numbered from
+        _leaf_starts[i] (included) to _leaf_ends[i] (excluded).
+    _max_weights:
+        The largest weight stored in each tree.
+    _weights:
+        The weight of each value.
+    _text:
+        If every value is a string, the UTF-8 encoding of all of them, and
+        None otherwise.
+    _text_offsets:
+        If every value is a string, value i is _text[_text_offsets[i]:
+        _text_offsets[i + 1]], and None otherwise.
+    _values:
+        If not every value is a string, the values, and None otherwise.
+    """
+    _louds: np.ndarray
+    _ones_before: np.ndarray
+    _zeros_before: np.ndarray
+    _edge_starts: np.ndarray
+    _edge_elements: np.ndarray
+    _element_ids: Dict[Any, int]
+    _leaf_starts: np.ndarray
+    _leaf_ends: np.ndarray
+    _max_weights: np.ndarray
+    _weights: np.ndarray
+    _text: Optional[bytes]
+    _text_offsets: Optional[np.ndarray]
+    _values: Optional[List]
+
+    def __init__(self, tree: Any) -> None:
+        """Initialize a frozen copy of the SimplePrefixTree or
+        CompressedPrefixTree <tree>.
+
+        <tree> is not changed, and later changes to it do not change this
+        copy.
+        """
+        # depth-first: the range of values of every non-leaf tree
+        values = []
+        weights = []
+        ranges = {}
+        stack = [(tree, False)]
+        while stack:
+            subtree, visited = stack.pop()
+            if visited:
+                ranges[id(subtree)].append(len(values))
+                continue
+            ranges[id(subtree)] = [len(values)]
+            inner = []
+            for child in subtree.subtrees:
+                if child.is_leaf():
+                    values.append(child.value)
+                    weights.append(child.weight)
+                else:
+                    inner.append(child)
+            stack.append((subtree, True))
+            stack.extend((child, False) for child in reversed(inner))
+
+        # level order: the LOUDS bits, edges and arrays of every tree
+        self._element_ids = {}
+        bits = [1, 0]
+        edge_starts = [0]
+        edge_elements = []
+        leaf_starts = []
+        leaf_ends = []
+        max_weights = []
+        queue = [tree]
+        for subtree in queue:
+            for element in subtree._edge():
+                edge_elements.append(self._element_ids.setdefault(
+                    element, len(self._element_ids)))
+            edge_starts.append(len(edge_elements))
+            leaf_starts.append(ranges[id(subtree)][0])
+            leaf_ends.append(ranges[id(subtree)][1])
+            max_weights.append(subtree._max_weight)
+            children = [child for child in subtree.subtrees
+                        if not child.is_leaf()]
+            for child in children:
+                self._element_ids.setdefault(child._edge()[0],
+                                             len(self._element_ids))
+            children.sort(key=lambda child:
+                          self._element_ids[child._edge()[0]])
+            queue.extend(children)
+            bits.extend([1] * len(children))
+            bits.append(0)
+
+        unpacked = np.array(bits, dtype=np.uint8)
+        self._louds = np.packbits(unpacked)
+        padded = np.zeros(-len(bits) % _BLOCK_BITS + len(bits), np.int64)
+        padded[:len(bits)] = unpacked
+        ones = np.concatenate(([0], np.cumsum(
+            padded.reshape(-1, _BLOCK_BITS).sum(axis=1))))
+        self._ones_before = ones.astype(np.int64)
+        self._zeros_before = (np.arange(len(ones), dtype=np.int64)
+                              * _BLOCK_BITS - self._ones_before)
+        self._edge_starts = _index_array(edge_starts)
+        self._edge_elements = _index_array(edge_elements)
+        self._leaf_starts = _index_array(leaf_starts)
+        self._leaf_ends = _index_array(leaf_ends)
+        self._max_weights = np.array(max_weights, dtype=np.float64)
+        self._weights = np.array(weights, dtype=np.float64)
+        if all(isinstance(value, str) for value in values):
+            encoded = [value.encode('utf-8') for value in values]
+            self._text = b''.join(encoded)
+            self._text_offsets = np.cumsum(
+                [0] + [len(data) for data in encoded], dtype=np.int64)
+            self._values = None
+        else:
+            self._text = self._text_offsets = None
+            self._values = values
+
+    def __len__(self) -> int:
+        """Return the number of values stored in this tree."""
+        return len(self._weights)
+
+    def _value(self, i: int) -> Any:
+        """Return value number <i>."""
+        if self._values is not None:
+            return self._values[i]
+        return self._text[self._text_offsets[i]:
+                          self._text_offsets[i + 1]].decode('utf-8')
+
+    def _rank1(self, position: int) -> int:
+        """Return the number of 1 bits before <position> in the LOUDS bits.
+        """
+        block = position // _BLOCK_BITS
+        start = block * _BLOCK_BYTES
+        rest = position - block * _BLOCK_BITS
+        return int(self._ones_before[block]) + int(np.unpackbits(
+            self._louds[start:start + _BLOCK_BYTES], count=rest).sum())
+
+    def _select0(self, k: int) -> int:
+        """Return the position of the <k>th 0 bit of the LOUDS bits.
+
+        Precondition: 1 <= k <= the number of 0 bits
+        """
+        block = int(np.searchsorted(self._zeros_before, k)) - 1
+        start = block * _BLOCK_BYTES
+        zeros = np.flatnonzero(np.unpackbits(
+            self._louds[start:start + _BLOCK_BYTES]) == 0)
+        return block * _BLOCK_BITS + int(
+            zeros[k - self._zeros_before[block] - 1])
+
+    def _subtrees(self, tree: int) -> Tuple[int, int]:
+        """Return the numbers of the first subtree of <tree> and of the
+        tree just after its last subtree.
+        """
+        start = self._select0(tree + 1) + 1
+        first = self._rank1(start)
+        return first, first + self._select0(tree + 2) - start
+
+    def _find_tree(self, prefix: List) -> Optional[int]:
+        """Return the number of the tree that stores exactly the values
+        matching <prefix>, or None if no value matches it.
+        """
+        try:
+            ids = [self._element_ids.get(element) for element in prefix]
+        except TypeError:
+            # an unhashable element can never have been inserted
+            return None
+        tree = 0
+        depth = 0
+        while True:
+            edge = self._edge_elements[self._edge_starts[tree]:
+                                       self._edge_starts[tree + 1]]
+            end = min(len(edge), len(ids) - depth)
+            if edge[:end].tolist() != ids[depth:depth + end]:
+                return None
+            depth += end
+            if depth == len(ids):
+                return tree
+            first, last = self._subtrees(tree)
+            if ids[depth] is None or first == last:
+                return None
+            firsts = self._edge_elements[self._edge_starts[first:last]]
+            i = int(np.searchsorted(firsts, ids[depth]))
+            if i == len(firsts) or firsts[i] != ids[depth]:
+                return None
+            tree = first + i
+
+    def autocomplete(self, prefix: List,
+                     limit: Optional[int] = None) -> List[Tuple[Any, float]]:
+        """Return up to <limit> matches for the given prefix, in
+        non-increasing order of weight.
+
+        The weights of all matches are selected from at once; ties are
+        broken in depth-first order.
+
+        Precondition: limit is None or limit > 0.
+        >>> from prefix_tree import CompressedPrefixTree
+        >>> tree = CompressedPrefixTree('sum')
+        >>> tree.insert('cat', 2.0, ['c', 'a', 't'])
+        >>> tree.insert('car', 3.0, ['c', 'a', 'r'])
+        >>> tree.insert('dog', 4.0, ['d', 'o', 'g'])
+        >>> frozen = tree.freeze()
+        >>> frozen.autocomplete(['c'])
+        [('car', 3.0), ('cat', 2.0)]
+        >>> frozen.autocomplete([], 1)
+        [('dog', 4.0)]
+        """
+        tree = self._find_tree(prefix)
+        if tree is None:
+            return []
+        start, end = self._leaf_starts[tree], self._leaf_ends[tree]
+        weights = -self._weights[start:end]
+        if limit is None or limit >= len(weights):
+            order = np.argsort(weights, kind='stable')
+        else:
+            best = np.argpartition(weights, limit - 1)[:limit]
+            order = best[np.lexsort((best, weights[best]))]
+        return [(self._value(start + i), -float(weights[i]))
+                for i in order.tolist()]
+
+    def iter_autocomplete(self, prefix: List) -> Iterator[Tuple[Any, float]]:
+        """Yield every match for the given prefix as a (value, weight) tuple,
+        in non-increasing order of weight.
+
+        Trees are explored best-first by their largest leaf weight, and only
+        when the next value is requested.
+        """
+        tree = self._find_tree(prefix)
+        if tree is None:
+            return
+        for i, weight in self._iter_tree(tree):
+            yield self._value(i), weight
+
+    def _iter_tree(self, tree: int) -> Iterator[Tuple[int, float]]:
+        """Yield the number and weight of every value stored in <tree>, in
+        non-increasing order of weight.
+        """
+        # ties are broken by the order in which trees and values were reached
+        order = itertools.count()
+        heap = [(-self._max_weights[tree], next(order), True, tree)]
+        while heap:
+            weight, _, is_tree, i = heapq.heappop(heap)
+            if not is_tree:
+                yield i, -float(weight)
+                continue
+            first, last = self._subtrees(i)
+            # the values of a tree's own leaves come before its subtrees'
+            own_end = self._leaf_starts[first:last].min() if first < last \
+                else self._leaf_ends[i]
+            for value in range(self._leaf_starts[i], own_end):
+                heapq.heappush(heap, (-self._weights[value], next(order),
+                                      False, value))
+            for subtree in range(first, last):
+                heapq.heappush(heap, (-self._max_weights[subtree],
+                                      next(order), True, subtree))
+
+    def fuzzy_autocomplete(self, prefix: List, max_distance: int = 1,
+                           limit: Optional[int] = None
+                           ) -> List[Tuple[Any, float]]:
+        """Return up to <limit> values whose prefix sequence starts with a
+        sequence at most <max_distance> edits away from <prefix>, closest
+        first and then in non-increasing order of weight.
+
+        See SimplePrefixTree.fuzzy_autocomplete, whose search this follows
+        over the edges of the frozen trees.
+        >>> from prefix_tree import CompressedPrefixTree
+        >>> tree = CompressedPrefixTree('sum')
+        >>> tree.insert('cat', 2.0, ['c', 'a', 't'])
+        >>> tree.insert('cut', 9.0, ['c', 'u', 't'])
+        >>> tree.insert('dog', 4.0, ['d', 'o', 'g'])
+        >>> tree.freeze().fuzzy_autocomplete(['c', 'a', 't'])
+        [('cat', 2.0), ('cut', 9.0)]
+        """
+        if len(self) == 0:
+            return []
+        # elements that were never inserted are compared as -1
+        ids = []
+        for element in prefix:
+            try:
+                ids.append(self._element_ids.get(element, -1))
+            except TypeError:
+                ids.append(-1)
+        # found[d] holds the trees whose value is exactly d edits away from
+        # prefix, and that are not inside a tree found at a smaller distance
+        found = [[] for _ in range(max_distance + 1)]
+        stack = [(0, list(range(len(ids) + 1)), max_distance + 1)]
+        while stack:
+            tree, row, best = stack.pop()
+            distance = min(best, row[-1])
+            for element in self._edge_elements[
+                    self._edge_starts[tree]:self._edge_starts[tree + 1]
+            ].tolist():
+                previous, row = row, [row[0] + 1]
+                for i, query_id in enumerate(ids):
+                    row.append(min(row[i] + 1, previous[i + 1] + 1,
+                                   previous[i] + (query_id != element)))
+                distance = min(distance, row[-1])
+                if min(row) >= distance:
+                    # no longer value in this branch is any closer
+                    break
+            if distance < best:
+                found[distance].append(tree)
+            if min(row) < distance:
+                first, last = self._subtrees(tree)
+                stack.extend((subtree, row, distance)
+                             for subtree in range(first, last))
+
+        result = []
+        seen = set()
+        for trees in found:
+            matches = heapq.merge(*[self._iter_tree(tree) for tree in trees],
+                                  key=lambda match: -match[1])
+            for i, weight in matches:
+                if limit is not None and len(result) == limit:
+                    return result
+                if i not in seen:
+                    seen.add(i)
+                    result.append((self._value(i), weight))
+        return result
+
+    def weight_of(self, value: Any) -> float:
+        """Return the weight of <value> in this tree, or 0.0 if <value> is
+        not stored in it.
+
+        Values are not indexed, to save memory, so they are all compared
+        with <value>: this takes O(n) time for a tree of n values.
+        """
+        for i in range(len(self._weights)):
+            if self._value(i) == value:
+                return float(self._weights[i])
+        return 0.0
+
+    def insert(self, value: Any, weight: float, prefix: List) -> None:
+        """Raise TypeError: a frozen prefix tree cannot be changed."""
+        raise TypeError('a frozen prefix tree cannot be changed')
+
+    def remove(self, prefix: List) -> None:
+        """Raise TypeError: a frozen prefix tree cannot be changed."""
+        raise TypeError('a frozen prefix tree cannot be changed')
+
+    def memory(self) -> int:
+        """Return the approximate number of bytes used by this tree.
+
+        Non-string values are shared with the tree it was frozen from, so
+        only the list holding them is counted.
+        """
+        arrays = [self._louds, self._ones_before, self._zeros_before,
+                  self._edge_starts, self._edge_elements, self._leaf_starts,
+                  self._leaf_ends, self._max_weights, self._weights]
+        total = sum(array.nbytes for array in arrays)
+        total += sum(sys.getsizeof(element) for element in self._element_ids)
+        total += sys.getsizeof(self._element_ids)
+        if self._values is not None:
+            return total + sys.getsizeof(self._values)
+        return total + len(self._text) + self._text_offsets.nbytes
+
+
+def _index_array(indices: List[int]) -> np.ndarray:
+    """Return <indices> as an array of 32-bit integers if they all fit, and
+    of 64-bit integers otherwise.
+    """
+    if len(indices) == 0 or max(indices) < 2 ** 31:
+        return np.array(indices, dtype=np.int32)
+    return np.array(indices, dtype=np.int64)
+
+
+if __name__ == '__main__':
+    import python_ta
+
+    python_ta.check_all(config={
+        'max-nested-blocks': 4
+    })
@@ -0,0 +1,88 @@
+import unittest
+from prefix_tree import *
+from autocomplete_engines import *
+from frozen_prefix_tree import FrozenPrefixTree
+
+
+def by_weight(matches):
+    return sorted(matches, key=lambda match: (-match[1], str(match[0])))
+
+
+class FrozenTest(unittest.TestCase):
+
+    def setUp(self):
+        self.trees = [SimplePrefixTree('sum'), CompressedPrefixTree('average')]
+        for tree in self.trees:
+            tree.insert('car', 20.0, ['c', 'a', 'r'])
+            tree.insert('care', 30.0, ['c', 'a', 'r', 'e'])
+            tree.insert('cat', 22.0, ['c', 'a', 't'])
+            tree.insert('danger', 10.0, ['d', 'a', 'n', 'g', 'e', 'r'])
+            tree.insert('c', 5.0, ['c'])
+
+    def test_matches_tree(self):
+        for tree in self.trees:
+            frozen = tree.freeze()
+            self.assertEqual(len(frozen), 5)
+            prefixes = [[], ['c'], ['c', 'a'], ['c', 'a', 'r', 'e'],
+                        ['c', 'a', 'r', 'e', 's'], ['d', 'a'], ['d', 'x'],
+                        ['x']]
+            for prefix in prefixes:
+                expected = tree.autocomplete(prefix)
+                self.assertEqual(by_weight(frozen.autocomplete(prefix)),
+                                 by_weight(expected))
+                self.assertEqual(frozen.autocomplete(prefix, 2),
+                                 expected[:2])
+                self.assertEqual(list(frozen.iter_autocomplete(prefix)),
+                                 frozen.autocomplete(prefix))
+            self.assertEqual(frozen.weight_of('cat'), 22.0)
+            self.assertEqual(frozen.weight_of('cow'), 0.0)
+
+    def test_fuzzy_matches_tree(self):
+        for tree in self.trees:
+            frozen = tree.freeze()
+            for prefix in [[], ['c', 'u', 't'], ['d', 'a', 'g'], ['x'],
+                           ['c', 'a', 'r', 'e', 's']]:
+                for max_distance in [0, 1, 2]:
+                    expected = tree.fuzzy_autocomplete(prefix, max_distance)
+                    self.assertEqual(frozen.fuzzy_autocomplete(
+                        prefix, max_distance), expected)
+                    self.assertEqual(frozen.fuzzy_autocomplete(
+                        prefix, max_distance, 2), expected[:2])
+        self.assertEqual(
+            CompressedPrefixTree('sum').freeze().fuzzy_autocomplete(['a']),
+            [])
+
+    def test_frozen_copy_is_read_only(self):
+        for tree in self.trees:
+            frozen = tree.freeze()
+            tree.remove(['c'])
+            self.assertEqual(len(frozen), 5)
+            self.assertRaises(TypeError, frozen.insert, 'x', 1.0, ['x'])
+            self.assertRaises(TypeError, frozen.remove, ['c'])
+
+    def test_empty_tree(self):
+        frozen = CompressedPrefixTree('sum').freeze()
+        self.assertEqual(len(frozen), 0)
+        self.assertEqual(frozen.autocomplete([]), [])
+        self.assertEqual(list(frozen.iter_autocomplete(['a'])), [])
+
+    def test_frozen_engines(self):
+        config = {'file': 'data/google_no_swears.txt',
+                  'autocompleter': 'compressed', 'weight_type': 'sum'}
+        engine = LetterAutocompleteEngine(config)
+        frozen = LetterAutocompleteEngine(dict(config, autocompleter='frozen'))
+        self.assertIsInstance(frozen.autocompleter, FrozenPrefixTree)
+        for prefix in ['', 'how', 'what is', 'zzzz']:
+            self.assertEqual(by_weight(frozen.autocomplete(prefix)),
+                             by_weight(engine.autocomplete(prefix)))
+        self.assertLess(frozen.autocompleter.memory(), 10 ** 6)
+        self.assertEqual(frozen.fuzzy_autocomplete('hwo to', 1, 5),
+                         engine.fuzzy_autocomplete('hwo to', 1, 5))
+        melodies = MelodyAutocompleteEngine({
+            'file': 'data/songbook.csv', 'autocompleter': 'frozen',
+            'weight_type': 'sum'})
+        self.assertEqual(len(melodies.autocomplete([], 2)), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+import threading
+import unittest
+import prefix_tree
+from prefix_tree import *
+
+
+class InstrumentationTest(unittest.TestCase):
+
+    def setUp(self):
+        self.trees = [SimplePrefixTree('sum'), CompressedPrefixTree('sum')]
+        for tree in self.trees:
+            for word in ['cat', 'car', 'cart', 'dog', 'do']:
+                tree.insert(word, float(len(word)), list(word))
+
+    def tearDown(self):
+        disable_instrumentation()
+
+    def test_explain_counts_one_query(self):
+        for tree in self.trees:
+            counters = tree.explain(['c'], 2)
+            self.assertEqual(counters['calls'], 1)
+            self.assertEqual(counters['matches'], 2)
+            self.assertEqual(counters['leaves_materialised'], 2)
+            self.assertGreater(counters['nodes_visited'], 0)
+            self.assertEqual(tree.explain(['x'])['matches'], 0)
+
+    def test_counts_by_operation(self):
+        stats = enable_instrumentation()
+        for tree in self.trees:
+            tree.insert('cab', 1.0, ['c', 'a', 'b'])
+            tree.autocomplete(['c', 'a'])
+            tree.remove(['d'])
+        self.assertEqual(stats.counts['insert']['calls'], 2)
+        self.assertEqual(stats.counts['autocomplete']['calls'], 2)
+        self.assertEqual(stats.counts['remove']['calls'], 2)
+        self.assertEqual(stats.counts['autocomplete']['leaves_materialised'],
+                         8)
+        self.assertGreater(stats.counts['insert']['sorts'], 0)
+
+    def test_disabled_restores_methods(self):
+        originals = [dict(SimplePrefixTree.__dict__),
+                     dict(CompressedPrefixTree.__dict__),
+                     prefix_tree.common_prefix]
+        enable_instrumentation()
+        self.assertIsNot(SimplePrefixTree.__dict__['insert'],
+                         originals[0]['insert'])
+        disable_instrumentation()
+        self.assertEqual([dict(SimplePrefixTree.__dict__),
+                          dict(CompressedPrefixTree.__dict__),
+                          prefix_tree.common_prefix], originals)
+        self.trees[0].explain(['c'])
+        self.assertIs(prefix_tree.common_prefix, originals[2])
+
+    def test_overlapping_explains(self):
+        originals = dict(SimplePrefixTree.__dict__)
+
+        class Paused(str):
+            """A prefix element pausing the lookup that hashes it."""
+            def __hash__(self):
+                self.inside.set()
+                self.finish.wait(5)
+                return str.__hash__(self)
+
+        results = {}
+        threads = {}
+        for word in ['c', 'd']:
+            element = Paused(word)
+            element.inside = threading.Event()
+            element.finish = threading.Event()
+            threads[word] = (element, threading.Thread(
+                target=lambda element=element: results.setdefault(
+                    str(element), self.trees[0].explain([element]))))
+        # 'c' starts first and also ends first
+        for word in ['c', 'd']:
+            threads[word][1].start()
+            self.assertTrue(threads[word][0].inside.wait(5))
+        for word in ['c', 'd']:
+            threads[word][0].finish.set()
+            threads[word][1].join(5)
+        self.assertEqual(results['c']['matches'], 3)
+        self.assertEqual(results['d']['matches'], 2)
+        self.assertEqual(results['d']['calls'], 1)
+        self.assertGreater(results['d']['leaves_materialised'], 0)
+        self.assertEqual(dict(SimplePrefixTree.__dict__), originals)
+
+    def test_explain_keeps_enabled_counters(self):
+        stats = enable_instrumentation()
+        self.trees[0].explain(['c'])
+        self.assertEqual(stats.counts['autocomplete']['calls'], 0)
+        self.trees[0].autocomplete(['c'])
+        self.assertEqual(stats.counts['autocomplete']['calls'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+import os
+import tempfile
+import unittest
+from autocomplete_engines import *
+
+
+class ParallelBuildTest(unittest.TestCase):
+
+    def assertSameEngine(self, engine_class, config):
+        sequential = engine_class(config)
+        parallel = engine_class(dict(config, workers=3))
+        self.assertEqual(parallel.autocompleter.autocomplete([]),
+                         sequential.autocompleter.autocomplete([]))
+        self.assertEqual(len(parallel.autocompleter),
+                         len(sequential.autocompleter))
+
+    def test_letter_engine(self):
+        for autocompleter in ['simple', 'compressed']:
+            self.assertSameEngine(LetterAutocompleteEngine, {
+                'file': 'data/google_no_swears.txt',
+                'autocompleter': autocompleter, 'weight_type': 'average'})
+
+    def test_sentence_engine_repeated_float_weights(self):
+        fd, path = tempfile.mkstemp(suffix='.csv')
+        with os.fdopen(fd, 'w') as f:
+            for i in range(200):
+                f.write(f'Query {i % 7}!,{0.1 * (i % 3)}\n')
+                f.write(f'query {i % 5},0.3\r\n')
+        try:
+            self.assertSameEngine(SentenceAutocompleteEngine, {
+                'file': path, 'autocompleter': 'compressed',
+                'weight_type': 'sum'})
+        finally:
+            os.remove(path)
+
+    def test_letter_engine_old_mac_line_endings(self):
+        fd, path = tempfile.mkstemp(suffix='.txt')
+        with os.fdopen(fd, 'wb') as f:
+            f.write('\r'.join(f'line {i % 40}' for i in range(500))
+                    .encode('utf8') + b'\n' +
+                    '\n'.join(f'café {i}' for i in range(100))
+                    .encode('utf8'))
+        try:
+            self.assertSameEngine(LetterAutocompleteEngine, {
+                'file': path, 'autocompleter': 'simple',
+                'weight_type': 'sum'})
+        finally:
+            os.remove(path)
+
+
+if __name__ == '__main__':
+    unittest.main()
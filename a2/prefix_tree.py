@@ -15,7 +15,96 @@ testing directly! You may, however, add new private attributes, methods, and
 top-level functions to this file.
 """
 from __future__ import annotations
-from typing import Any, List, Optional, Tuple
+from array import array
+from collections import Counter
+import heapq
+import io
+import itertools
+import mmap
+import pickle
+import struct
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, \
+    Tuple
+
+
+# Snapshot files start with this header: the magic bytes, whether the file is
+# little-endian, compressed and 'average'-weighted, the kind of pool, and the
+# number of trees, prefix elements, pooled objects and pool bytes.
+_SNAPSHOT_MAGIC = b'PFXTREE1'
+_SNAPSHOT_HEADER = struct.Struct('<8s????4xqqqq')
+_POOL_TEXT = 0
+_POOL_PICKLE = 1
+
+# A DecayingPrefixTree rescales its stored weights once inserted weights are
+# this many times larger than the weights of its epoch.
+_RENORMALISE_GROWTH = 2.0 ** 20
+
+
+def _padded(data: bytes) -> bytes:
+    """Return <data> padded with zero bytes to a multiple of 8 bytes."""
+    return data + bytes(-len(data) % 8)
+
+
+def _encode_pool(pool: List) -> Tuple[int, bytes]:
+    """Return the kind and bytes of a snapshot pool storing <pool>.
+
+    A pool of strings is stored as the character offset of each string,
+    followed by all of them as UTF-8 text. Any other pool is pickled, and
+    read back with a _SnapshotUnpickler.
+    """
+    if all(isinstance(obj, str) for obj in pool):
+        offsets = array('q', [0])
+        for obj in pool:
+            offsets.append(offsets[-1] + len(obj))
+        return _POOL_TEXT, offsets.tobytes() + ''.join(pool).encode('utf-8')
+    return _POOL_PICKLE, pickle.dumps(pool, pickle.HIGHEST_PROTOCOL)
+
+
+def _decode_pool(kind: int, data: bytes, size: int,
+                 classes: Iterable[type]) -> List:
+    """Return the <size> objects of the snapshot pool of <kind> in <data>,
+    whose objects may be instances of <classes>.
+    """
+    if kind == _POOL_PICKLE:
+        return _SnapshotUnpickler(data, classes).load()
+    offsets = array('q')
+    offsets.frombytes(data[:(size + 1) * offsets.itemsize])
+    text = data[(size + 1) * offsets.itemsize:].decode('utf-8')
+    return [text[offsets[i]:offsets[i + 1]] for i in range(size)]
+
+
+class _SnapshotUnpickler(pickle.Unpickler):
+    """An unpickler for the pools of snapshots, which cannot run code.
+
+    Pickles can call any function they name, so this unpickler refuses to
+    look up any function or class, except the given classes of values. It
+    still builds the strings, numbers, None and containers that pickle
+    stores directly.
+
+    === Attributes ===
+    classes:
+        The classes that may be looked up, keyed by their module and name.
+    """
+    classes: Dict[Tuple[str, str], type]
+
+    def __init__(self, data: bytes, classes: Iterable[type]) -> None:
+        """Initialize an unpickler of <data> that only looks up <classes>.
+        """
+        super().__init__(io.BytesIO(data))
+        self.classes = {(cls.__module__, cls.__qualname__): cls
+                        for cls in classes}
+
+    def find_class(self, module: str, name: str) -> Any:
+        """Return the class <name> of <module> if it is allowed, and raise
+        pickle.UnpicklingError otherwise.
+        """
+        if (module, name) not in self.classes:
+            raise pickle.UnpicklingError(
+                f'{module}.{name} is not allowed in a snapshot')
+        return self.classes[(module, name)]
 
 
 ################################################################################
@@ -24,6 +113,7 @@ from typing import Any, List, Optional, Tuple
 class Autocompleter:
     """An abstract class representing the Autocompleter Abstract Data Type.
     """
+    __slots__ = ()
 
     def __len__(self) -> int:
         """Return the number of values stored in this Autocompleter."""
@@ -47,6 +137,18 @@ class Autocompleter:
         """
         raise NotImplementedError
 
+    def bulk_load(self, entries: Iterable[Tuple[Any, float, List]]) -> None:
+        """Insert every (value, weight, prefix) tuple in <entries> into this
+        Autocompleter.
+
+        This has the same effect as inserting the entries one at a time, but
+        subclasses may build their structure much faster this way.
+
+        Preconditions: every entry satisfies the preconditions of insert.
+        """
+        for value, weight, prefix in entries:
+            self.insert(value, weight, prefix)
+
     def autocomplete(self, prefix: List,
                      limit: Optional[int] = None) -> List[Tuple[Any, float]]:
         """Return up to <limit> matches for the given prefix.
@@ -60,6 +162,44 @@ class Autocompleter:
         """
         raise NotImplementedError
 
+    def iter_autocomplete(self, prefix: List) -> Iterator[Tuple[Any, float]]:
+        """Yield every match for the given prefix as a (value, weight) tuple,
+        in non-increasing order of weight.
+
+        Subclasses may compute the matches lazily, as they are consumed.
+        """
+        return iter(self.autocomplete(prefix))
+
+    def batch_autocomplete(self, prefixes: List[List],
+                           limit: Optional[int] = None
+                           ) -> List[List[Tuple[Any, float]]]:
+        """Return the result of autocomplete(prefix, limit) for every prefix in
+        <prefixes>, in the same order.
+
+        Precondition: limit is None or limit > 0.
+        """
+        return [self.autocomplete(prefix, limit) for prefix in prefixes]
+
+    def fuzzy_autocomplete(self, prefix: List, max_distance: int = 1,
+                           limit: Optional[int] = None
+                           ) -> List[Tuple[Any, float]]:
+        """Return up to <limit> values whose prefix sequence starts with a
+        sequence at most <max_distance> insertions, deletions or
+        substitutions away from <prefix>, as (value, weight) tuples.
+
+        Matches are ordered by that distance first, and then in non-increasing
+        weight. If limit is None, return *every* match.
+
+        Precondition: max_distance >= 0, and limit is None or limit > 0.
+        """
+        raise NotImplementedError
+
+    def weight_of(self, value: Any) -> float:
+        """Return the weight of <value> in this Autocompleter, or 0.0 if
+        <value> is not stored in it.
+        """
+        raise NotImplementedError
+
     def remove(self, prefix: List) -> None:
         """Remove all values that match the given prefix.
         """
@@ -89,8 +229,37 @@ class SimplePrefixTree(Autocompleter):
         A list of subtrees of this prefix tree.
     _count:
         The number of leaves in this prefix tree.
+    _weight_sum:
+        The sum of the leaf weights in this prefix tree.
+    _max_weight:
+        The largest leaf weight in this prefix tree. Unlike the aggregate
+        weight, this is an upper bound on the weight of every value stored
+        in this tree.
     _weight_type:
         The weighting type of the prefix tree.
+    _before:
+        The parent of this prefix tree, or None if this tree is the root.
+    _label:
+        If this tree is a leaf, the value stored in it. Otherwise the last
+        element of self.value (None for the root); the rest of self.value is
+        the value of self._before, so it is only rebuilt when read.
+    _depth:
+        The length of self.value, if this tree is not a leaf.
+    _children:
+        The non-leaf subtrees of this prefix tree, keyed by the prefix
+        element that extends self.value to the subtree's value.
+    _leaves:
+        If this tree is the root, every leaf of the whole prefix tree, keyed
+        by the value it stores (None until a value is inserted). None for
+        every other tree.
+        Leaves have neither _children nor _leaves (both are None).
+    _cache_limit:
+        The number of top matches cached at every non-leaf tree, or 0 if
+        top matches are not cached.
+    _top:
+        The (up to) _cache_limit heaviest (value, weight) pairs stored in this
+        tree, in non-increasing weight order, or None if this tree is a leaf
+        or top matches are not cached.
 
     === Representation invariants ===
     - self.weight >= 0
@@ -118,28 +287,91 @@ class SimplePrefixTree(Autocompleter):
       both can appear in the same self.subtrees list, and both have a `weight`
       attribute.
     """
-    value: Any
+    # A letter prefix tree has hundreds of thousands of nodes, so nodes do
+    # not carry an instance __dict__.
+    __slots__ = ('_label', '_depth', 'weight', 'subtrees', '_count',
+                 '_weight_sum', '_max_weight', '_weight_type', '_before',
+                 '_children', '_leaves', '_cache_limit', '_top')
     weight: float
     subtrees: List[SimplePrefixTree]
     _count: int
+    _weight_sum: float
+    _max_weight: float
     _weight_type: str
     _before: Optional[SimplePrefixTree]
-
-    def __init__(self, weight_type: str) -> None:
+    _label: Any
+    _depth: int
+    _children: Optional[Dict[Any, SimplePrefixTree]]
+    _leaves: Optional[Dict[Any, SimplePrefixTree]]
+    _cache_limit: int
+    _top: Optional[List[Tuple[Any, float]]]
+
+    def __init__(self, weight_type: str, cache_limit: int = 0) -> None:
         """Initialize an empty simple prefix tree.
 
         Precondition: weight_type == 'sum' or weight_type == 'average'.
+                      cache_limit >= 0
 
         The given <weight_type> value specifies how the aggregate weight
         of non-leaf trees should be calculated (see the assignment handout
         for details).
+
+        If <cache_limit> is positive, every non-leaf tree keeps its
+        <cache_limit> heaviest matches, so that autocomplete with a limit of
+        at most <cache_limit> does not need to search the tree.
         """
-        self.value = []
+        self._label = None
+        self._depth = 0
         self.subtrees = []
-        self._weight_type = weight_type
+        # every node of every tree shares one copy of the weight type string
+        self._weight_type = sys.intern(weight_type)
         self.weight = 0.0
         self._count = 0
+        self._weight_sum = 0.0
+        self._max_weight = 0.0
         self._before = None
+        self._children = {}
+        self._leaves = None
+        self._cache_limit = cache_limit
+        self._top = [] if cache_limit > 0 else None
+
+    @property
+    def value(self) -> Any:
+        """The value stored at the root of this prefix tree: the inserted value
+        if this tree is a leaf, and its prefix otherwise.
+
+        Internal trees only store the last element of their prefix, so the
+        prefix is rebuilt from the ancestors of this tree.
+        >>> tree = SimplePrefixTree('sum')
+        >>> tree.insert('car', 20, ['c', 'a', 'r'])
+        >>> tree.value
+        []
+        >>> tree.subtrees[0].subtrees[0].value
+        ['c', 'a']
+        >>> tree.subtrees[0].subtrees[0].subtrees[0].subtrees[0].value
+        'car'
+        """
+        if self._children is None:
+            return self._label
+        prefix = [None] * self._depth
+        tree = self
+        for i in range(self._depth - 1, -1, -1):
+            prefix[i] = tree._label
+            tree = tree._before
+        return prefix
+
+    @value.setter
+    def value(self, value: Any) -> None:
+        """Set the value stored at the root of this prefix tree.
+
+        Precondition: if this tree is not a leaf, <value> is its parent's
+        value extended by one element.
+        """
+        if self._children is None:
+            self._label = value
+        else:
+            self._label = value[-1] if len(value) > 0 else None
+            self._depth = len(value)
 
     def is_empty(self) -> bool:
         """Return whether this simple prefix tree is empty."""
@@ -157,21 +389,31 @@ class SimplePrefixTree(Autocompleter):
         >>> tree.__len__()
         2
         """
-        # meaning count number of leaves
-        if self._before is None and len(self.subtrees) == 0:
-            return 0
-        if self.is_leaf():
-            return 1
+        # meaning count number of leaves, which is maintained on every
+        # insert and remove
+        return self._count
+
+    def _set_weight(self) -> None:
+        """Recompute the aggregate weight of this tree from its leaf count
+        and leaf weight sum.
+        """
+        if self._count == 0:
+            self._weight_sum = 0.0
+            self.weight = 0.0
+        elif self._weight_type == 'average':
+            self.weight = self._weight_sum / self._count
         else:
-            # inner node case
-            total_leaf = 0
-            for subtree in self.subtrees:
-                total_leaf += subtree.__len__()
-            return total_leaf
+            self.weight = self._weight_sum
 
-    def _update_weight(self, weight: float) -> None:
+    def _update_weight(self, count: int, weight: float) -> None:
         """
-        Update the weight of the tree.
+        Add <count> leaves with a total leaf weight of <weight> to every
+        ancestor of this tree, update their largest leaf weight and cached
+        top matches, and move each changed tree to its sorted position among
+        its siblings.
+
+        Precondition: count >= 0 and weight > 0. (Leaves are removed with
+        _detach.)
         >>> tree = SimplePrefixTree("average")
         >>> tree.insert("car", 30, ['c','a','r'])
         >>> tree.subtrees[0].subtrees[0].weight
@@ -179,28 +421,87 @@ class SimplePrefixTree(Autocompleter):
         >>> tree.insert('care', 20, ['c','a','r','e'])
         >>> tree.weight
         25.0
-        >>> print(tree.__str__())
         >>> tree.insert('cat', 22, ['c','a','t'])
         >>> tree.weight
         24.0
-        >>> print(tree.__str__())
         >>> tree.insert('care', 20, ['c','a','r','e'])
-        >>> print(tree.__str__())
+        >>> tree.weight
+        30.666666666666668
+        """
+        child, temp = self, self._before
+        while temp is not None:
+            temp._count += count
+            temp._weight_sum += weight
+            temp._set_weight()
+            temp._max_weight = max(temp._max_weight, child._max_weight)
+            temp._reposition(child)
+            if temp._top is not None:
+                temp._refresh_top()
+            child, temp = temp, temp._before
+
+    def _refresh_top(self) -> None:
+        """Recompute the cached top matches of this tree from its subtrees.
+
+        Precondition: the cached top matches of every subtree are up to date.
         """
-        temp = self
-        while temp._before is not None:
-            if temp._weight_type == "sum":
-                temp._before._count = temp._before.__len__()
-                temp._before.weight += weight
-            elif temp._weight_type == "average":
-                if temp._before.__len__() == 0:
-                    temp._before.weight = 0
-                else:
-                    total = temp._before.weight * temp._before._count + weight
-                    temp._before.weight = total / temp._before.__len__()
-                    temp._before._count = temp._before.__len__()
-            temp._before._sort_weight()
-            temp = temp._before
+        candidates = []
+        for subtree in self.subtrees:
+            if subtree.is_leaf():
+                candidates.append((subtree.value, subtree.weight))
+            else:
+                candidates.extend(subtree._top)
+        self._top = heapq.nlargest(self._cache_limit, candidates,
+                                   key=lambda match: match[1])
+
+    def cache_memory(self) -> int:
+        """Return the approximate number of bytes used by the cached top
+        matches in this tree.
+
+        The values themselves are shared with the leaves, so they are not
+        counted.
+        >>> tree = SimplePrefixTree('sum')
+        >>> tree.insert('car', 20, ['c', 'a', 'r'])
+        >>> tree.cache_memory()
+        0
+        """
+        total = 0
+        stack = [self]
+        while stack:
+            tree = stack.pop()
+            if tree._top is not None:
+                total += sys.getsizeof(tree._top)
+                total += sum(sys.getsizeof(match) for match in tree._top)
+            stack.extend(tree.subtrees)
+        return total
+
+    def _scale_weights(self, factor: float) -> None:
+        """Multiply the weight of every value stored in this tree by
+        <factor>, keeping every leaf weight positive.
+
+        The order of subtrees does not change, since every weight is scaled
+        by the same factor.
+
+        Precondition: factor > 0
+        """
+        stack = [self]
+        while stack:
+            tree = stack.pop()
+            if tree.is_leaf():
+                tree.weight = max(tree.weight * factor, sys.float_info.min)
+                tree._weight_sum = tree._max_weight = tree.weight
+                continue
+            tree.weight *= factor
+            tree._weight_sum *= factor
+            tree._max_weight *= factor
+            if tree._top is not None:
+                tree._top = [(value, weight * factor)
+                             for value, weight in tree._top]
+            stack.extend(tree.subtrees)
+
+    def _new_tree(self) -> SimplePrefixTree:
+        """Return a new empty tree of the same class and settings as this one.
+        """
+        return type(self)(self._weight_type, self._cache_limit)
 
     def insert(self, value: Any, weight: float, prefix: List) -> None:
         """Insert the given value into this Autocompleter.
@@ -262,63 +563,433 @@ class SimplePrefixTree(Autocompleter):
         >>> cutewang.subtrees[0].subtrees[0].value
         'car'
         """
-        if prefix == self.value:
-            # base case
-            flag1 = True
-            for subtree in self.subtrees:
-                if subtree.value == value:
-                    subtree.weight += weight
-                    subtree._update_weight(weight)
-                    flag1 = False
-            # leaf not exist
-            if flag1:
-                new_leave = SimplePrefixTree(self._weight_type)
-                new_leave.value, new_leave.weight = value, weight
-                new_leave._before = self
-                self.subtrees.append(new_leave)
-                new_leave._update_weight(weight)
-                new_leave._count += 1
-        elif prefix != self.value:
-            # have not find the subtree that match entirely with prefix yet
-            flag2 = True
-            for subtree in self.subtrees:
-                if prefix[0:len(subtree.value)] == subtree.value:
-                    subtree.insert(value, weight, prefix)
-                    flag2 = False
-            # does not exist a subtree that match the current prefix
-            # create a subtree that match the current prefix
-            if flag2:
-                self.insert_subtree(prefix[len(self.value)])
-                self.subtrees[-1].insert(value, weight, prefix)
+        if self._leaves is None:
+            self._leaves = {}
+        leaf = self._leaves.get(value)
+        if leaf is not None:
+            # a value is always inserted with the same prefix, so its leaf
+            # is found without walking down the tree
+            leaf._add_weight(weight)
+            return
+        # walk down to the tree whose value is the whole prefix, creating
+        # subtrees that match the current prefix as we go
+        tree = self
+        depth = self._depth
+        while depth < len(prefix):
+            subtree = tree._children.get(prefix[depth])
+            if subtree is None:
+                subtree = tree.insert_subtree(prefix[depth])
+            tree = subtree
+            depth += 1
+        leaf = tree._new_leaf(value, weight)
+        self._leaves[value] = leaf
+        leaf._update_weight(1, weight)
+
+    def _new_leaf(self, value: Any, weight: float) -> SimplePrefixTree:
+        """Append a new leaf storing <value> with <weight> to the subtrees of
+        this tree, and return it.
+
+        The aggregate weights of the ancestors are not updated, and the leaf
+        is not added to the leaf index of the root.
+        """
+        leaf = self._new_tree()
+        leaf._children = leaf._leaves = leaf._top = None
+        leaf._label, leaf.weight = value, weight
+        leaf._count, leaf._weight_sum, leaf._max_weight = 1, weight, weight
+        leaf._before = self
+        self.subtrees.append(leaf)
+        return leaf
+
+    def _add_weight(self, weight: float) -> None:
+        """Add <weight> to the weight of this leaf and of its ancestors."""
+        self.weight += weight
+        self._weight_sum = self._max_weight = self.weight
+        self._update_weight(0, weight)
+
+    def _unindex(self, tree: SimplePrefixTree) -> None:
+        """Remove every leaf of <tree> from the leaf index of this root."""
+        stack = [tree]
+        while stack:
+            subtree = stack.pop()
+            if subtree.is_leaf():
+                del self._leaves[subtree.value]
+            else:
+                stack.extend(subtree.subtrees)
+
+    def _detach(self) -> SimplePrefixTree:
+        """Remove this non-leaf tree from its parent, subtract its leaves from
+        every ancestor, and return the closest ancestor that still has
+        subtrees (or the root, if none does).
+
+        Only values are stored at leaves, so ancestors other than the root
+        that are left without any subtrees are removed as well. The
+        ancestors are visited once, from the parent up to the root.
+
+        The leaf weight sum of each ancestor is added up again from its
+        subtrees rather than decreased by the removed weight, which could
+        cancel out the much smaller weights that remain.
+        """
+        count = self._count
+        max_weight = self._max_weight
+        kept = None
+        child, parent = self, self._before
+        while parent is not None:
+            if kept is None:
+                parent.subtrees.remove(child)
+                del parent._children[child._edge()[0]]
+                if len(parent.subtrees) == 0 and parent._before is not None:
+                    child, parent = parent, parent._before
+                    continue
+                kept = parent
+            parent._count -= count
+            parent._weight_sum = sum(subtree._weight_sum
+                                     for subtree in parent.subtrees)
+            parent._set_weight()
+            # the largest leaf weight can only drop if a removed leaf had it
+            if parent._max_weight <= max_weight:
+                parent._max_weight = max(
+                    [subtree._max_weight for subtree in parent.subtrees],
+                    default=0.0)
+            parent._reposition(child)
+            if parent._top is not None:
+                parent._refresh_top()
+            child, parent = parent, parent._before
+        return kept
+
+    def weight_of(self, value: Any) -> float:
+        """Return the weight of <value> in this prefix tree, or 0.0 if
+        <value> is not stored in it.
+
+        The leaf storing <value> is found in the leaf index of the root, so
+        the tree is not searched.
+        >>> tree = SimplePrefixTree('average')
+        >>> tree.insert('cat', 2.0, ['c', 'a', 't'])
+        >>> tree.insert('cat', 1.5, ['c', 'a', 't'])
+        >>> tree.weight_of('cat')
+        3.5
+        >>> tree.weight_of('dog')
+        0.0
+        """
+        leaf = self._leaves.get(value) if self._leaves is not None else None
+        return 0.0 if leaf is None else leaf.weight
+
+    def explain(self, prefix: List,
+                limit: Optional[int] = None) -> Dict[str, int]:
+        """Return the counters of the work done by autocomplete(prefix, limit)
+        on this tree (see TraversalStats), and the number of matches.
+
+        The call is counted with its own counters, which are not added to
+        those of enable_instrumentation, so explain is safe to call from
+        several threads at once.
+        >>> tree = SimplePrefixTree('sum')
+        >>> tree.insert('cat', 2.0, ['c', 'a', 't'])
+        >>> tree.insert('car', 3.0, ['c', 'a', 'r'])
+        >>> tree.explain(['c', 'a'], 1)['matches']
+        1
+        """
+        stats = TraversalStats()
+        previous = getattr(_explaining, 'stats', None)
+        with _instrumentation_lock:
+            _install_counters()
+        _explaining.stats = stats
+        try:
+            matches = self.autocomplete(prefix, limit)
+        finally:
+            _explaining.stats = previous
+            with _instrumentation_lock:
+                _restore_counters()
+        counters = dict(stats.counts['autocomplete'])
+        counters['matches'] = len(matches)
+        return counters
+
+    def freeze(self) -> Any:
+        """Return a read-only FrozenPrefixTree copy of this tree, which uses
+        much less memory.
+
+        NumPy is only needed to freeze trees.
+        """
+        from frozen_prefix_tree import FrozenPrefixTree
+        return FrozenPrefixTree(self)
 
     def __lt__(self, other: SimplePrefixTree) -> bool:
         return self.weight < other.weight
 
-    def _sort_weight(self) -> None:
-        """Sort the subtrees of the SimplePrefixTree into non-increasing order
-        >>> tree = SimplePrefixTree("average")
+    def _reposition(self, subtree: SimplePrefixTree) -> None:
+        """Move <subtree> within self.subtrees so that the list is sorted in
+        non-increasing order of weight again, after the weight of <subtree>
+        changed.
+
+        Only the subtrees between the old and new position of <subtree> are
+        shifted, and ties keep their relative order. If <subtree> is not one
+        of the subtrees of this tree (it has just been removed), nothing is
+        moved.
+        >>> tree = SimplePrefixTree("sum")
         >>> tree.insert("car", 20, ['c','a','r'])
-        >>> tree.insert('care', 30, ['c', 'a', 'r', 'e'])
-        >>> tree.subtrees[0].subtrees[0].subtrees[0].value
-        ['c', 'a', 'r']
-        >>> len(tree.subtrees[0].subtrees[0].subtrees[0].subtrees)
-        2
-        >>> tree.subtrees[0].subtrees[0].subtrees[0].subtrees[0].weight
-        20
-        >>> tree.subtrees[0].subtrees[0].subtrees[0]._sort_weight()
-        >>> tree.subtrees[0].subtrees[0].subtrees[0].subtrees[0].weight
-        30.0
+        >>> tree.insert('cat', 30, ['c', 'a', 't'])
+        >>> parent = tree.subtrees[0].subtrees[0]
+        >>> [subtree.value for subtree in parent.subtrees]
+        [['c', 'a', 't'], ['c', 'a', 'r']]
+        >>> last = parent.subtrees[1]
+        >>> last.weight = 40
+        >>> parent._reposition(last)
+        >>> [subtree.value for subtree in parent.subtrees]
+        [['c', 'a', 'r'], ['c', 'a', 't']]
         """
-        self.subtrees.sort(reverse=True)
-
-    def insert_subtree(self, first_prefix: str) -> None:
+        subtrees = self.subtrees
+        if subtree not in subtrees:
+            return
+        i = subtrees.index(subtree)
+        while i > 0 and subtrees[i - 1].weight < subtree.weight:
+            subtrees[i] = subtrees[i - 1]
+            i -= 1
+        while i < len(subtrees) - 1 and subtrees[i + 1].weight > subtree.weight:
+            subtrees[i] = subtrees[i + 1]
+            i += 1
+        subtrees[i] = subtree
+
+    def insert_subtree(self, first_prefix: Any) -> SimplePrefixTree:
         """
-        Insert a subtree path to new value
+        Insert a subtree path to new value, and return the new subtree.
         """
-        new_subtree = SimplePrefixTree(self._weight_type)
-        new_subtree.value = self.value + [first_prefix]
+        new_subtree = self._new_tree()
+        new_subtree._label, new_subtree._depth = first_prefix, self._depth + 1
         new_subtree._before = self
         self.subtrees.append(new_subtree)
+        self._children[first_prefix] = new_subtree
+        return new_subtree
+
+    def _child(self, element: Any) -> Optional[SimplePrefixTree]:
+        """Return the subtree whose value extends self.value by <element>,
+        or None if there is no such subtree.
+        """
+        try:
+            return self._children.get(element)
+        except TypeError:
+            # an unhashable element can never have been inserted
+            return None
+
+    def bulk_load(self, entries: Iterable[Tuple[Any, float, List]]) -> None:
+        """Insert every (value, weight, prefix) tuple in <entries> into this
+        prefix tree.
+
+        If this tree is empty, it is built in a single pass: entries with
+        the same value are merged first, then the entries are sorted by
+        prefix, so that the values sharing a subtree are next to each other.
+        Every aggregate weight and subtrees list is computed exactly once.
+        Otherwise, the merged entries are inserted one at a time.
+
+        Preconditions: every entry satisfies the preconditions of insert,
+                       and the prefix elements can be compared with <.
+        >>> tree = SimplePrefixTree('sum')
+        >>> tree.bulk_load([('cat', 2.0, ['c', 'a', 't']),
+        ...                 ('dog', 4.0, ['d', 'o', 'g']),
+        ...                 ('cat', 1.5, ['c', 'a', 't'])])
+        >>> tree.autocomplete([])
+        [('dog', 4.0), ('cat', 3.5)]
+        >>> tree.subtrees[1].value
+        ['c']
+        """
+        merged = {}
+        for value, weight, prefix in entries:
+            if value in merged:
+                merged[value][1] += weight
+            else:
+                merged[value] = [value, weight, list(prefix)]
+        if not self.is_empty():
+            for value, weight, prefix in merged.values():
+                self.insert(value, weight, prefix)
+            return
+        items = sorted(merged.values(), key=lambda item: item[2])
+        if len(items) == 0:
+            return
+
+        # create the trees top-down; items[lo:hi] are exactly the entries
+        # whose prefix starts with the value of tree, which has length depth
+        self._leaves = {}
+        internal = []
+        stack = [(self, 0, len(items),
+                  self._bulk_root(items[0][2], items[-1][2]))]
+        while stack:
+            tree, lo, hi, depth = stack.pop()
+            internal.append(tree)
+            # shorter prefixes sort first, so the leaves come first
+            while lo < hi and len(items[lo][2]) == depth:
+                value, weight, _ = items[lo]
+                self._leaves[value] = tree._new_leaf(value, weight)
+                lo += 1
+            while lo < hi:
+                end = lo + 1
+                while end < hi and items[end][2][depth] == items[lo][2][depth]:
+                    end += 1
+                subtree, sub_depth = tree._bulk_subtree(
+                    items[lo][2], items[end - 1][2], depth)
+                stack.append((subtree, lo, end, sub_depth))
+                lo = end
+
+        # every subtree was created after its parent, so going backwards
+        # computes each aggregate after those of its subtrees
+        for tree in reversed(internal):
+            tree._count = sum(subtree._count for subtree in tree.subtrees)
+            tree._weight_sum = sum(subtree._weight_sum
+                                   for subtree in tree.subtrees)
+            tree._max_weight = max(subtree._max_weight
+                                   for subtree in tree.subtrees)
+            tree._set_weight()
+            tree.subtrees.sort(key=lambda subtree: subtree.weight,
+                               reverse=True)
+            if tree._top is not None:
+                tree._refresh_top()
+
+    def _bulk_root(self, first: List, last: List) -> int:
+        """Prepare this empty tree to be the root of a bulk load whose
+        smallest and largest prefixes are <first> and <last>, and return
+        the length of its value.
+        """
+        return self._depth
+
+    def _bulk_subtree(self, first: List, last: List,
+                      depth: int) -> Tuple[SimplePrefixTree, int]:
+        """Create the subtree of this tree holding every bulk loaded prefix
+        between <first> and <last> (which agree up to index <depth>), and
+        return it with the length of its value.
+        """
+        return self._attach_subtree(first[depth:depth + 1]), depth + 1
+
+    def _edge(self) -> List:
+        """Return the elements that the value of this non-leaf tree adds to
+        the value of its parent (all of self.value for the root).
+        """
+        return [] if self._before is None else [self._label]
+
+    def _attach_subtree(self, edge: List) -> SimplePrefixTree:
+        """Append a new empty subtree whose value is self.value + <edge> to
+        the subtrees of this tree, and return it.
+        """
+        return self.insert_subtree(edge[0])
+
+    def save(self, path: str) -> None:
+        """Write a snapshot of this prefix tree to the file <path>.
+
+        The snapshot is a flat table of the trees in pre-order (parent index,
+        prefix elements or value, count and weights), followed by a pool of
+        the distinct values and prefix elements. The pool is stored as UTF-8
+        text when it only contains strings, and pickled otherwise (see load
+        for the values that can be read back).
+
+        Use the load class method to read the snapshot back.
+        """
+        columns = [array('i'), array('i'), array('i'), array('q'),
+                   array('d'), array('d'), array('d')]
+        parents, refs, lengths, counts, weights, sums, maxes = columns
+        elements = array('i')
+        pool = []
+        pool_index = {}
+        stack = [(self, -1)]
+        while stack:
+            tree, parent = stack.pop()
+            index = len(parents)
+            parents.append(parent)
+            leaf = tree.is_leaf()
+            objects = [tree.value] if leaf else tree._edge()
+            indices = []
+            for obj in objects:
+                if obj not in pool_index:
+                    pool_index[obj] = len(pool)
+                    pool.append(obj)
+                indices.append(pool_index[obj])
+            if leaf:
+                refs.append(indices[0])
+                lengths.append(-1)
+            else:
+                refs.append(len(elements))
+                lengths.append(len(indices))
+                elements.extend(indices)
+            counts.append(tree._count)
+            weights.append(tree.weight)
+            sums.append(tree._weight_sum)
+            maxes.append(tree._max_weight)
+            stack.extend((subtree, index)
+                         for subtree in reversed(tree.subtrees))
+
+        pool_kind, pool_data = _encode_pool(pool)
+        with open(path, 'wb') as f:
+            f.write(_SNAPSHOT_HEADER.pack(
+                _SNAPSHOT_MAGIC, sys.byteorder == 'little',
+                isinstance(self, CompressedPrefixTree),
+                self._weight_type == 'average', pool_kind,
+                len(parents), len(elements), len(pool), len(pool_data)))
+            for column in columns + [elements]:
+                f.write(_padded(column.tobytes()))
+            f.write(pool_data)
+
+    @classmethod
+    def load(cls, path: str, cache_limit: int = 0,
+             classes: Iterable[type] = ()) -> SimplePrefixTree:
+        """Return the prefix tree stored in the snapshot file <path>.
+
+        Each column of the node table is converted to a list in one step,
+        but the trees are then built one at a time in Python, so the
+        memory map saves nothing over reading the file.
+
+        Values and prefix elements may be built-in strings, numbers, None
+        and containers of them, or instances of <classes>. Loading a
+        snapshot never calls any other function or class, so a crafted file
+        cannot run code. Raise pickle.UnpicklingError if the snapshot holds
+        an object of any other class. The file is otherwise only checked to
+        be a snapshot of class <cls>, so a corrupted file may still give a
+        tree that breaks the representation invariants.
+
+        Precondition: <path> was written by the save method of a tree of
+        class <cls>. cache_limit >= 0 (see the initializer).
+        """
+        with open(path, 'rb') as f, \
+                mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data, \
+                memoryview(data) as view:
+            (magic, little_endian, compressed, average, pool_kind, n, m,
+             pool_size, pool_bytes) = _SNAPSHOT_HEADER.unpack_from(data)
+            if (magic != _SNAPSHOT_MAGIC
+                    or little_endian != (sys.byteorder == 'little')
+                    or compressed != issubclass(cls, CompressedPrefixTree)):
+                raise ValueError(f'{path} is not a {cls.__name__} snapshot')
+            columns = []
+            offset = _SNAPSHOT_HEADER.size
+            for typecode, length in [('i', n), ('i', n), ('i', n), ('q', n),
+                                     ('d', n), ('d', n), ('d', n), ('i', m)]:
+                size = array(typecode).itemsize * length
+                columns.append(view[offset:offset + size].cast(typecode)
+                               .tolist())
+                offset += len(_padded(bytes(size)))
+            pool = _decode_pool(pool_kind, bytes(view[offset:offset
+                                                      + pool_bytes]),
+                                pool_size, classes)
+        parents, refs, lengths, counts, weights, sums, maxes, elements = \
+            columns
+
+        root = cls('average' if average else 'sum', cache_limit)
+        root._leaves = {}
+        trees = []
+        internal = []
+        for i in range(n):
+            if lengths[i] < 0:
+                leaf = trees[parents[i]]._new_leaf(pool[refs[i]], weights[i])
+                root._leaves[leaf.value] = leaf
+                trees.append(leaf)
+                continue
+            edge = [pool[e] for e in elements[refs[i]:refs[i] + lengths[i]]]
+            if parents[i] < 0:
+                tree = root
+                if len(edge) > 0:
+                    tree.value = edge
+            else:
+                tree = trees[parents[i]]._attach_subtree(edge)
+            tree._count, tree.weight = counts[i], weights[i]
+            tree._weight_sum, tree._max_weight = sums[i], maxes[i]
+            trees.append(tree)
+            internal.append(tree)
+        if root._top is not None:
+            for tree in reversed(internal):
+                tree._refresh_top()
+        return root
 
     def _get_all_match(self) -> List[Tuple[Any, float]]:
         """
@@ -327,15 +998,59 @@ class SimplePrefixTree(Autocompleter):
         result = []
         if self.is_empty():
             return []
-        elif self.is_leaf():
-            # self.subtree == []
-            leaf = (self.value, self.weight)
-            result.append(leaf)
-            return result
-        else:
-            for subtree in self.subtrees:
-                result += subtree._get_all_match()
-            return sorted(result, key=lambda x: x[1], reverse=True)
+        stack = [self]
+        while stack:
+            tree = stack.pop()
+            if tree.is_leaf():
+                result.append((tree.value, tree.weight))
+            else:
+                # reversed, so that subtrees are visited in order
+                stack.extend(reversed(tree.subtrees))
+        return sorted(result, key=lambda x: x[1], reverse=True)
+
+    def _top_matches(self, limit: Optional[int]) -> List[Tuple[Any, float]]:
+        """Return up to <limit> values stored in this tree, in non-increasing
+        order of weight, or every value if limit is None.
+
+        If top matches are cached and <limit> is small enough, they are
+        returned directly. Otherwise subtrees are explored best-first by their
+        largest leaf weight, so the search stops as soon as <limit> leaves have
+        been reached.
+        >>> tree = SimplePrefixTree('sum')
+        >>> tree.insert('cat', 2.0, ['c', 'a', 't'])
+        >>> tree.insert('car', 3.0, ['c', 'a', 'r'])
+        >>> tree.insert('dog', 4.0, ['d', 'o', 'g'])
+        >>> tree._top_matches(2)
+        [('dog', 4.0), ('car', 3.0)]
+        """
+        if self.is_empty() or limit == 0:
+            return []
+        elif limit is None or limit >= self._count:
+            return self._get_all_match()
+        elif self._top is not None and limit <= self._cache_limit:
+            return self._top[:limit]
+        return list(itertools.islice(self._iter_matches(), limit))
+
+    def _iter_matches(self) -> Iterator[Tuple[Any, float]]:
+        """Yield every value stored in this tree with its weight, in
+        non-increasing order of weight.
+
+        Subtrees are explored best-first by their largest leaf weight, and
+        only when the next value is requested.
+        """
+        if self.is_empty():
+            return
+        # ties are broken by the order in which subtrees were reached
+        order = 0
+        heap = [(-self._max_weight, order, self)]
+        while heap:
+            tree = heapq.heappop(heap)[2]
+            if tree.is_leaf():
+                yield tree.value, tree.weight
+            else:
+                for subtree in tree.subtrees:
+                    order += 1
+                    heapq.heappush(heap, (-subtree._max_weight, order, subtree))
 
     def _find_tree(self, prefix: List) -> Optional[SimplePrefixTree]:
         """
@@ -360,15 +1075,62 @@ class SimplePrefixTree(Autocompleter):
         >>> tree.insert('carep', 40, ['c','a','r','e','p'])
         >>> subtree4 = tree._find_tree([])
         """
-        if self.value[0:len(prefix)] == prefix or self.is_leaf():
-            # find prefix
-            return self
-        else:
-            # len(prefix) != 0:
-            for subtree in self.subtrees:
-                if prefix[0:len(subtree.value)] == subtree.value:
-                    return subtree._find_tree(prefix)
-            return None
+        tree = self
+        depth = self._depth
+        while depth < len(prefix) and not tree.is_leaf():
+            tree = tree._child(prefix[depth])
+            if tree is None:
+                return None
+            depth += 1
+        return tree
+
+    def _path(self, prefix: List) -> List[SimplePrefixTree]:
+        """Return the trees visited when looking up <prefix> in this tree,
+        starting with this tree.
+        """
+        path = [self]
+        depth = self._depth
+        while depth < len(prefix):
+            tree = path[-1]._child(prefix[depth])
+            if tree is None:
+                break
+            path.append(tree)
+            depth += 1
+        return path
+
+    def _copy(self) -> SimplePrefixTree:
+        """Return a copy of this tree that shares its subtrees, but not the
+        lists and dicts that hold them.
+        """
+        copy = self._new_tree()
+        for cls in type(self).__mro__:
+            for attribute in cls.__dict__.get('__slots__', ()):
+                setattr(copy, attribute, getattr(self, attribute))
+        copy.subtrees = list(self.subtrees)
+        if self._children is not None:
+            copy._children = dict(self._children)
+        return copy
+
+    def _copy_path(self, prefix: List) -> List[SimplePrefixTree]:
+        """Return copies of the trees visited when looking up <prefix> in this
+        root, linked to each other in place of the originals.
+
+        The first copy is the root of a new version of this tree, which
+        shares every other tree with this one. This tree is not changed, and
+        neither is the new version where it is shared, so only the copies may
+        be mutated. The leaf index of the root is shared as well: it always
+        describes the newest version.
+        """
+        copies = []
+        for tree in self._path(prefix):
+            copy = tree._copy()
+            if len(copies) > 0:
+                parent = copies[-1]
+                parent.subtrees[parent.subtrees.index(tree)] = copy
+                parent._children[tree._edge()[0]] = copy
+                copy._before = parent
+            copies.append(copy)
+        return copies
 
     def autocomplete(self, prefix: List,
                      limit: Optional[int] = None) -> List[Tuple[Any, float]]:
@@ -386,8 +1148,7 @@ class SimplePrefixTree(Autocompleter):
         >>> tree2.insert('Bob', 10, ['a', 'd'])
         >>> tree2.insert('K', 9, ['a', 'd'])
         >>> tree2.autocomplete(['a'], 3)
-        []
-        assert the tree we want to return leaf is found
+        [('Bob', 10), ('Jacky', 10), ('K', 9)]
         >>> tree = SimplePrefixTree("average")
         >>> tree.insert("car", 20, ['c','a','r'])
         >>> tree.insert('care', 30, ['c', 'a', 'r', 'e'])
@@ -400,9 +1161,9 @@ class SimplePrefixTree(Autocompleter):
         >>> tree.autocomplete(['c'], 1)
         [('care', 30)]
         >>> tree.autocomplete(['c'], 2)
-        [('care', 30), ('car', 20)]
+        [('care', 30), ('cat', 22)]
         >>> tree.autocomplete([], 2)
-        [('care', 30), ('car', 20)]
+        [('care', 30), ('cat', 22)]
         >>> tree.autocomplete([], 3)
         [('care', 30), ('cat', 22), ('car', 20)]
         >>> tree.insert('carep', 40, ['c','a','r','e','p'])
@@ -414,20 +1175,138 @@ class SimplePrefixTree(Autocompleter):
         >>> tree.autocomplete(['c'], 2)
         [('carep', 40), ('care', 30)]
         """
-        if self._find_tree(prefix) is not None:
-            if limit is None or limit >= self._find_tree(prefix)._count:
-                return self._find_tree(prefix)._get_all_match()
-            else:
-                # limit < self._count
-                acc = []
-                for subtree in self._find_tree(prefix).subtrees:
-                    acc += subtree.autocomplete(prefix, limit)
-                    # print(acc)
-                    if len(acc) >= limit:
-                        return sorted(acc[: limit], key=lambda x: x[1],
-                                      reverse=True)
-        else:
+        tree = self._find_tree(prefix)
+        if tree is None:
             return []
+        return tree._top_matches(limit)
+
+    def iter_autocomplete(self, prefix: List) -> Iterator[Tuple[Any, float]]:
+        """Yield every match for the given prefix as a (value, weight) tuple,
+        in non-increasing order of weight.
+
+        Matches are found one at a time, so taking only the first few of them
+        does not visit or sort the rest.
+        >>> tree = SimplePrefixTree('sum')
+        >>> tree.insert('cat', 2.0, ['c', 'a', 't'])
+        >>> tree.insert('car', 3.0, ['c', 'a', 'r'])
+        >>> tree.insert('dog', 4.0, ['d', 'o', 'g'])
+        >>> matches = tree.iter_autocomplete(['c'])
+        >>> next(matches)
+        ('car', 3.0)
+        >>> list(matches)
+        [('cat', 2.0)]
+        """
+        tree = self._find_tree(prefix)
+        if tree is None:
+            return iter([])
+        return tree._iter_matches()
+
+    def batch_autocomplete(self, prefixes: List[List],
+                           limit: Optional[int] = None
+                           ) -> List[List[Tuple[Any, float]]]:
+        """Return the result of autocomplete(prefix, limit) for every prefix in
+        <prefixes>, in the same order.
+
+        The prefixes are visited in sorted order, and the path of trees found
+        for one prefix is kept for the next one, so the trees on their shared
+        path are only looked up once.
+
+        Precondition: limit is None or limit > 0.
+        >>> tree = SimplePrefixTree('sum')
+        >>> tree.insert('cat', 2.0, ['c', 'a', 't'])
+        >>> tree.insert('car', 3.0, ['c', 'a', 'r'])
+        >>> tree.batch_autocomplete([['c', 'a', 't'], ['d'], ['c']], 1)
+        [[('cat', 2.0)], [], [('car', 3.0)]]
+        """
+        results = [[] for _ in prefixes]
+        # path[i] is the tree whose value is the first i elements of the
+        # previous prefix, or None if there is no such tree
+        path = [self]
+        previous = []
+        for i in sorted(range(len(prefixes)), key=prefixes.__getitem__):
+            prefix = prefixes[i]
+            del path[len(common_prefix(previous, prefix)) + 1:]
+            while path[-1] is not None and len(path) <= len(prefix):
+                path.append(path[-1]._child(prefix[len(path) - 1]))
+            if path[-1] is not None:
+                results[i] = path[-1]._top_matches(limit)
+            previous = prefix
+        return results
+
+    def fuzzy_autocomplete(self, prefix: List, max_distance: int = 1,
+                           limit: Optional[int] = None
+                           ) -> List[Tuple[Any, float]]:
+        """Return up to <limit> values whose prefix sequence starts with a
+        sequence at most <max_distance> insertions, deletions or
+        substitutions away from <prefix>, as (value, weight) tuples.
+
+        Matches are ordered by that distance first, and then in non-increasing
+        weight. If limit is None, return *every* match.
+
+        The trees are walked depth-first with one row of the Levenshtein
+        table of <prefix> per prefix element, and a branch is abandoned as
+        soon as every entry of its row is over <max_distance>. The matches of
+        the trees found are then taken best-first, so that only <limit> of
+        them are ever reached.
+
+        Precondition: max_distance >= 0, and limit is None or limit > 0.
+        >>> tree = SimplePrefixTree('sum')
+        >>> tree.insert('cat', 2.0, ['c', 'a', 't'])
+        >>> tree.insert('cart', 3.0, ['c', 'a', 'r', 't'])
+        >>> tree.insert('dog', 4.0, ['d', 'o', 'g'])
+        >>> tree.fuzzy_autocomplete(['c', 'a', 't'], 1)
+        [('cat', 2.0), ('cart', 3.0)]
+        >>> tree.fuzzy_autocomplete(['c', 'o', 'g'], 1, 1)
+        [('dog', 4.0)]
+        """
+        return [(value, weight) for _, value, weight in
+                self._fuzzy_matches(prefix, max_distance, limit)]
+
+    def _fuzzy_matches(self, prefix: List, max_distance: int,
+                       limit: Optional[int]) -> List[Tuple[int, Any, float]]:
+        """Return the matches of fuzzy_autocomplete(prefix, max_distance,
+        limit) as (distance, value, weight) tuples, where distance is the
+        number of edits of the match.
+        """
+        if self.is_empty():
+            return []
+        # found[d] holds the trees whose value is exactly d edits away from
+        # prefix, and that are not inside a tree found at a smaller distance
+        found = [[] for _ in range(max_distance + 1)]
+        stack = [(self, list(range(len(prefix) + 1)), max_distance + 1)]
+        while stack:
+            tree, row, best = stack.pop()
+            # the value before the first element of the edge counts too: it
+            # is the root's empty value, which a compressed root skips
+            distance = min(best, row[-1])
+            for element in tree._edge():
+                previous, row = row, [row[0] + 1]
+                for i in range(len(prefix)):
+                    row.append(min(row[i] + 1, previous[i + 1] + 1,
+                                   previous[i] + (prefix[i] != element)))
+                distance = min(distance, row[-1])
+                if min(row) >= distance:
+                    # no longer value in this branch is any closer
+                    break
+            distance = min(distance, row[-1])
+            if distance < best:
+                found[distance].append(tree)
+            if min(row) < distance:
+                for subtree in tree._children.values():
+                    stack.append((subtree, row, distance))
+
+        result = []
+        seen = set()
+        for distance, trees in enumerate(found):
+            matches = heapq.merge(*[tree._iter_matches() for tree in trees],
+                                  key=lambda match: -match[1])
+            for value, weight in matches:
+                if limit is not None and len(result) == limit:
+                    return result
+                if value not in seen:
+                    seen.add(value)
+                    result.append((distance, value, weight))
+        return result
 
     def __str__(self) -> str:
 
@@ -447,11 +1326,14 @@ class SimplePrefixTree(Autocompleter):
 
         if self.is_empty():
             return ''
-        else:
-            s = '  ' * depth + f'{self.value} ({self.weight})\n'
-            for subtree in self.subtrees:
-                s += subtree._str_indented(depth + 1)
-            return s
+        lines = []
+        stack = [(self, depth)]
+        while stack:
+            tree, d = stack.pop()
+            lines.append('  ' * d + f'{tree.value} ({tree.weight})\n')
+            stack.extend((subtree, d + 1)
+                         for subtree in reversed(tree.subtrees))
+        return ''.join(lines)
 
     def remove(self, prefix: List) -> None:
 
@@ -463,22 +1345,16 @@ class SimplePrefixTree(Autocompleter):
         >>> tree.remove(['c', 'a', 'r'])
         """
         current = self._find_tree(prefix)
-        if current == self:
+        if current is self:
             self.subtrees = []
+            self._children, self._leaves = {}, None
+            self._count, self._weight_sum, self._max_weight = 0, 0.0, 0.0
+            if self._top is not None:
+                self._top = []
             self.weight = 0.0
         elif current is not None:
-            for subtree in current._before.subtrees:
-                if subtree.value == prefix:
-                    current._before.subtrees.remove(subtree)
-                    if self._weight_type == 'average':
-                        current._update_weight(-current.weight * current._count)
-                    else:
-                        current._update_weight(-current.weight)
-                    # sum of self.leave weight instead of self.weight
-            if len(current._before.subtrees) == 0:
-                if current._before._before is not None:
-                    current._before._before.remove(current._before.value)
-            # do we really need else here?
+            self._unindex(current)
+            current._detach()
 
 
 ################################################################################
@@ -525,6 +1401,17 @@ class CompressedPrefixTree(SimplePrefixTree):
     subtrees:
         A list of subtrees of this prefix tree.
 
+    The private attributes are those of SimplePrefixTree, except that _label
+    stores the whole value of non-leaf trees, and _children keys every
+    non-leaf subtree by the first element of its *edge*, the part of its
+    value that extends self.value. In addition:
+
+    _edge_start:
+        The length of the value of the parent of this tree (0 for the root),
+        where its edge starts. It is stored rather than read from _before,
+        so that published versions of a VersionedPrefixTree never change
+        when a later version moves their shared trees to a new parent.
+
     === Representation invariants ===
     - self.weight >= 0
 
@@ -549,91 +1436,46 @@ class CompressedPrefixTree(SimplePrefixTree):
       both can appear in the same self.subtrees list, and both have a `weight`
       attribute.
     """
+    __slots__ = ('_edge_start',)
     value: Optional[Any]
     weight: float
     subtrees: List[CompressedPrefixTree]
     _count: int
     _weight_type: str
     _before: Optional[CompressedPrefixTree]
+    _edge_start: int
 
-    def __init__(self, weight_type: str) -> None:
+    def __init__(self, weight_type: str, cache_limit: int = 0) -> None:
         """Initialize an empty compressed prefix tree.
 
         Precondition: weight_type == 'sum' or weight_type == 'average'.
+                      cache_limit >= 0
 
         The given <weight_type> value specifies how the aggregate weight
         of non-leaf trees should be calculated (see the assignment handout
         for details).
-        """
-        SimplePrefixTree.__init__(self, weight_type)
-
-    def common_tree(self, prefix: List) -> Optional[CompressedPrefixTree]:
-        """
-        Return the internal value in the compressed tree that has the longest
-        common prefix with prefix.
-        >>> tree = CompressedPrefixTree("average")
-        >>> tree.insert("car", 30.0, ['c','a','r'])
-        >>> tree.insert('care', 20.0, ['c', 'a', 'r', 'e'])
-        >>> t = tree.common_tree(['c', 'a', 't'])
-        >>> t.value
-        """
-        if len(prefix) == 0:
-            return self
-        elif self.is_leaf():
-            return self._before
-        # elif len(self.common_prefix(self.value, prefix)) != 0:
-        #     longest = len(self.common_prefix(self.value, prefix))
-        #     for subtree in self.subtrees:
-        #       if len(subtree.common_prefix(subtree.value, prefix)) > longest:
-        #           longest = len(subtree.common_prefix(subtree.value, prefix))
-        #     if longest == len(self.common_prefix(self.value, prefix)):
-        #         return self
-        #     else:
-        #         return subtree
-        else:
-            i = 0
-            flag = False
-            while i < len(self.subtrees) and len(common_prefix(
-                    self.subtrees[i].value,
-                    prefix)) == 0:
-                if self.subtrees[i].is_leaf():
-                    flag = True
-                i += 1
-            if i == len(self.subtrees):
-                if flag and common_prefix(self.value, prefix) != []:
-                    return self
-                else:
-                    return None
-            com_b = common_prefix(self.value, prefix)
-            for subtree in self.subtrees:
-                if com_b != common_prefix(subtree.value, prefix):
-                    return subtree.common_tree(prefix)
-            return self
-
-    def add_leaf(self, value: Any, weight: float) -> None:
-        """
-        Add a leaf with value and weight to an internal value of
-        the prefix tree and update the weight.
-        """
-        leaf = CompressedPrefixTree(self._weight_type)
-        leaf.value, leaf.weight = value, weight
-        leaf._before = self
-        self.subtrees.append(leaf)
-        leaf._count += 1
-        leaf._update_weight(weight)
 
-    def insert_root(self) -> CompressedPrefixTree:
+        If <cache_limit> is positive, every non-leaf tree keeps its
+        <cache_limit> heaviest matches (see SimplePrefixTree).
         """
-        Insert root.
+        SimplePrefixTree.__init__(self, weight_type, cache_limit)
+        self._label = []
+        self._edge_start = 0
+
+    @property
+    def value(self) -> Any:
+        """The value stored at the root of this prefix tree: the inserted value
+        if this tree is a leaf, and its whole prefix otherwise.
+
+        Compressed trees have few internal trees, so each of them stores its
+        whole prefix.
         """
-        tree = CompressedPrefixTree(self._weight_type)
-        tree.weight = self.weight
-        tree._count = self._count
-        for i in self.value:
-            tree.value.append(i)
-        for j in self.subtrees:
-            tree.subtrees.append(j)
-        return tree
+        return self._label
+
+    @value.setter
+    def value(self, value: Any) -> None:
+        """Set the value stored at the root of this prefix tree."""
+        self._label = value
 
     def insert(self, value: Any, weight: float, prefix: List) -> None:
         """
@@ -660,60 +1502,131 @@ class CompressedPrefixTree(SimplePrefixTree):
         >>> tree2.insert('p', 8, ['c'])
         >>> print(tree2.__str__())
         """
-        common = self.common_tree(prefix)
-        # common = self
-        if common is not None:
-            # common = self
-            common_pre = common_prefix(prefix, common.value)
-            # self.value partial ['a,'b']
-            if len(common_pre) == len(common.value):
-                if common_pre == prefix:
-                    flag = True
-                    for subtree in common.subtrees:
-                        if subtree.value == value:
-                            subtree.weight += weight
-                            subtree._update_weight(weight)
-                            flag = False
-                    if flag:
-                        common.add_leaf(value, weight)
-                else:
-                    inter = CompressedPrefixTree(self._weight_type)
-                    common.subtrees.append(inter)
-                    inter._before = common
-                    inter.value = prefix
-                    inter.add_leaf(value, weight)
-            elif len(common_pre) < len(common.value):
-                tree = common.insert_root()
-                common.value = common_pre
-                common.subtrees = [tree]
-                tree._before = common
-                # [c,a]
-                inter3 = CompressedPrefixTree(common._weight_type)
-                inter3.value = prefix
-                common.subtrees.append(inter3)
-                inter3._before = common
-                inter3.add_leaf(value, weight)
-        else:
-            if self.is_empty():
-                self.value = prefix
-                self.add_leaf(value, weight)
-            elif self.value != []:
-                # self.is not empty
-                tree = self.insert_root()
-                self.subtrees = [tree]
-                self.value = []
-                tree._before = self
-                inter2 = CompressedPrefixTree(self._weight_type)
-                inter2._before = self
-                inter2.value = prefix
-                self.subtrees.append(inter2)
-                inter2.add_leaf(value, weight)
-            else:
-                inter3 = CompressedPrefixTree(self._weight_type)
-                inter3._before = self
-                inter3.value = prefix
-                self.subtrees.append(inter3)
-                inter3.add_leaf(value, weight)
+        if self._leaves is None:
+            self._leaves = {}
+        leaf = self._leaves.get(value)
+        if leaf is not None:
+            # a value is always inserted with the same prefix, so its leaf
+            # is found without searching the tree
+            leaf._add_weight(weight)
+            return
+        if self.is_empty():
+            self.value = list(prefix)
+        elif len(common_prefix(self.value, prefix)) < len(self.value):
+            self._split_root(len(common_prefix(self.value, prefix)))
+        # walk down the edges that match prefix, which are found by their
+        # first element; only the last one may need to be split
+        tree = self
+        depth = len(self.value)
+        while depth < len(prefix):
+            subtree = tree._child(prefix[depth])
+            if subtree is None:
+                tree = tree._attach_subtree(prefix[depth:])
+                break
+            end = min(len(subtree.value), len(prefix))
+            shared = depth + 1
+            while shared < end and subtree.value[shared] == prefix[shared]:
+                shared += 1
+            if shared < len(subtree.value):
+                subtree = tree._split(subtree, shared)
+            tree, depth = subtree, shared
+        leaf = tree._new_leaf(value, weight)
+        self._leaves[value] = leaf
+        leaf._update_weight(1, weight)
+
+    def _split(self, subtree: CompressedPrefixTree,
+               length: int) -> CompressedPrefixTree:
+        """Insert a new tree whose value is the first <length> elements of
+        the value of <subtree> between this tree and <subtree>, and return it.
+
+        The new tree has the same leaves as <subtree>, so it takes the place
+        of <subtree> among the subtrees of this tree with the same weights.
+
+        Precondition: <subtree> is a non-leaf subtree of this tree, and
+        len(self.value) < length < len(subtree.value).
+        """
+        middle = self._new_tree()
+        middle.value = subtree.value[:length]
+        middle._before = self
+        middle._edge_start = len(self.value)
+        middle._take_weights(subtree)
+        middle.subtrees.append(subtree)
+        middle._children[subtree.value[length]] = subtree
+        self.subtrees[self.subtrees.index(subtree)] = middle
+        self._children[middle.value[len(self.value)]] = middle
+        subtree._before = middle
+        subtree._edge_start = length
+        return middle
+
+    def _split_root(self, length: int) -> None:
+        """Move the subtrees of this root into a new subtree with the same
+        value, and keep only the first <length> elements of the value of this
+        root.
+
+        Precondition: this tree is a non-empty root, and
+        length < len(self.value).
+        """
+        subtree = self._new_tree()
+        subtree.value = self.value
+        subtree._before = self
+        subtree._edge_start = length
+        subtree._take_weights(self)
+        subtree.subtrees, subtree._children = self.subtrees, self._children
+        for child in subtree.subtrees:
+            child._before = subtree
+        self.value = self.value[:length]
+        self.subtrees = [subtree]
+        self._children = {subtree.value[length]: subtree}
+
+    def _take_weights(self, other: CompressedPrefixTree) -> None:
+        """Copy the count, weights and cached top matches of the non-leaf
+        tree <other>, which has the same leaves as this tree.
+        """
+        self._count, self.weight = other._count, other.weight
+        self._weight_sum, self._max_weight = other._weight_sum, \
+            other._max_weight
+        if self._top is not None:
+            self._top = list(other._top)
+
+    def _bulk_root(self, first: List, last: List) -> int:
+        """Prepare this empty tree to be the root of a bulk load whose
+        smallest and largest prefixes are <first> and <last>, and return
+        the length of its value.
+
+        The root holds the prefix shared by every value, if any.
+        """
+        self.value = common_prefix(first, last)[:]
+        return len(self.value)
+
+    def _bulk_subtree(self, first: List, last: List,
+                      depth: int) -> Tuple[CompressedPrefixTree, int]:
+        """Create the subtree of this tree holding every bulk loaded prefix
+        between <first> and <last> (which agree up to index <depth>), and
+        return it with the length of its value.
+
+        The prefixes are sorted, so every one of them starts with the common
+        prefix of <first> and <last>, and the subtree holds all of it.
+        """
+        subtree = self._attach_subtree(common_prefix(first, last)[depth:])
+        return subtree, len(subtree.value)
+
+    def _edge(self) -> List:
+        """Return the elements that the value of this non-leaf tree adds to
+        the value of its parent (all of self.value for the root).
+        """
+        return self.value[self._edge_start:]
+
+    def _attach_subtree(self, edge: List) -> CompressedPrefixTree:
+        """Append a new empty subtree whose value is self.value + <edge> to
+        the subtrees of this tree, and return it.
+        """
+        subtree = self._new_tree()
+        subtree.value = self.value + edge
+        subtree._before = self
+        subtree._edge_start = len(self.value)
+        self.subtrees.append(subtree)
+        self._children[edge[0]] = subtree
+        return subtree
 
     def _compressed_find_tree(self, prefix: List) -> Optional[
         CompressedPrefixTree]:
@@ -735,19 +1648,38 @@ class CompressedPrefixTree(SimplePrefixTree):
         >>> tree2._compressed_find_tree(['a']).value
         []
         """
-        if self.value[0:len(prefix)] == prefix or self.is_leaf():
-            # find prefix
-            return self
-        else:
-            # len(prefix) != 0:
-            for subtree in self.subtrees:
-                if len(subtree.value) < len(prefix):
-                    if subtree.value == prefix[0:len(subtree.value)]:
-                        return subtree._compressed_find_tree(prefix)
-                elif len(subtree.value) >= len(prefix):
-                    if subtree.value[0:len(prefix)] == prefix:
-                        return subtree._compressed_find_tree(prefix)
-            return None
+        tree = self
+        depth = 0
+        while True:
+            end = min(len(tree.value), len(prefix))
+            if tree.value[depth:end] != prefix[depth:end]:
+                return None
+            elif end == len(prefix):
+                return tree
+            tree, depth = tree._child(prefix[end]), end
+            if tree is None:
+                return None
+
+    def _path(self, prefix: List) -> List[CompressedPrefixTree]:
+        """Return the trees visited when looking up <prefix> in this tree,
+        starting with this tree.
+
+        The last tree is the one whose edge does not match <prefix>, or whose
+        value extends <prefix>, if there is one.
+        """
+        path = [self]
+        depth = 0
+        while True:
+            tree = path[-1]
+            end = min(len(tree.value), len(prefix))
+            if tree.value[depth:end] != prefix[depth:end] or \
+                    end == len(prefix):
+                return path
+            subtree = tree._child(prefix[end])
+            if subtree is None:
+                return path
+            path.append(subtree)
+            depth = end
 
     def autocomplete(self, prefix: List,
                      limit: Optional[int] = None) -> List[Tuple[Any, float]]:
@@ -775,20 +1707,58 @@ class CompressedPrefixTree(SimplePrefixTree):
         >>> print(tree2.__str__())
         """
         # assert the tree we want to return leaf is found
-        if self._compressed_find_tree(prefix) is not None:
-            if limit is None or limit >= self._compressed_find_tree(prefix)._count:
-                return self._compressed_find_tree(prefix)._get_all_match()
-            else:
-                # limit < self._count
-                acc = []
-                for subtree in self._compressed_find_tree(prefix).subtrees:
-                    acc += subtree.autocomplete(prefix, limit)
-                    # print(acc)
-                    if len(acc) >= limit:
-                        return sorted(acc[: limit], key=lambda x: x[1],
-                                      reverse=True)
-        else:
+        tree = self._compressed_find_tree(prefix)
+        if tree is None:
             return []
+        return tree._top_matches(limit)
+
+    def iter_autocomplete(self, prefix: List) -> Iterator[Tuple[Any, float]]:
+        """Yield every match for the given prefix as a (value, weight) tuple,
+        in non-increasing order of weight, finding them one at a time.
+        """
+        tree = self._compressed_find_tree(prefix)
+        if tree is None:
+            return iter([])
+        return tree._iter_matches()
+
+    def batch_autocomplete(self, prefixes: List[List],
+                           limit: Optional[int] = None
+                           ) -> List[List[Tuple[Any, float]]]:
+        """Return the result of autocomplete(prefix, limit) for every prefix in
+        <prefixes>, in the same order.
+
+        The prefixes are visited in sorted order, and the path of trees found
+        for one prefix is kept for the next one, so the trees on their shared
+        path are only looked up once.
+
+        Precondition: limit is None or limit > 0.
+        """
+        results = [[] for _ in prefixes]
+        # the values of all but the last tree of path are prefixes of the
+        # previous prefix; the last one matches it, or is None
+        path = []
+        previous = []
+        for i in sorted(range(len(prefixes)), key=prefixes.__getitem__):
+            prefix = prefixes[i]
+            shared = len(common_prefix(previous, prefix))
+            while len(path) > 0 and (path[-1] is None
+                                     or len(path[-1].value) > shared):
+                path.pop()
+            if len(path) == 0:
+                end = min(len(self.value), len(prefix))
+                path.append(self if self.value[:end] == prefix[:end] else None)
+            while path[-1] is not None and len(path[-1].value) < len(prefix):
+                start = len(path[-1].value)
+                subtree = path[-1]._child(prefix[start])
+                if subtree is not None:
+                    end = min(len(subtree.value), len(prefix))
+                    if subtree.value[start:end] != prefix[start:end]:
+                        subtree = None
+                path.append(subtree)
+            if path[-1] is not None:
+                results[i] = path[-1]._top_matches(limit)
+            previous = prefix
+        return results
 
     def remove(self, prefix: List) -> None:
         """Remove all values that match the given prefix.
@@ -812,39 +1782,556 @@ class CompressedPrefixTree(SimplePrefixTree):
         >>> print(tree.__str__())
         """
         current = self._compressed_find_tree(prefix)
-        # ['c',a,r]
-        if current == self:
+        if current is self:
             self.subtrees = []
+            self._children, self._leaves = {}, None
+            self._count, self._weight_sum, self._max_weight = 0, 0.0, 0.0
+            if self._top is not None:
+                self._top = []
             self.weight = 0.0
             self.value = []
         elif current is not None:
-            # # find the prefix tree
-            # for subtree in current._before.subtrees:
-            #     if subtree.value[0:len(prefix)] == prefix:
-            #         current._before.subtrees.remove(subtree)
-            current._before.subtrees.remove(current)
-            if self._weight_type == 'average':
-                current._update_weight(-current.weight * current._count)
+            self._unindex(current)
+            parent = current._detach()
+            if len(parent.subtrees) == 1 and not parent.subtrees[0].is_leaf():
+                parent._merge_subtree()
+
+    def _merge_subtree(self) -> None:
+        """Merge this tree with its only subtree, which is not a leaf, so
+        that this tree is no longer compressible.
+
+        Both trees have the same leaves, and so the same weights, so this
+        tree takes over the value and subtrees of its subtree. The subtree
+        itself is left unchanged: in a VersionedPrefixTree, it may be shared
+        with published versions, while this tree is a copy.
+        """
+        subtree = self.subtrees[0]
+        self.value = subtree.value
+        self.subtrees, self._children = subtree.subtrees, subtree._children
+        for child in self.subtrees:
+            child._before = self
+
+
+################################################################################
+# Instrumentation
+################################################################################
+class TraversalStats:
+    """Counters of the work done by prefix tree operations while
+    instrumentation is enabled.
+
+    The counters are:
+        - calls: the number of operations
+        - nodes_visited: trees looked up, tested or reweighted
+        - prefix_comparisons: child lookups and common_prefix calls
+        - list_copies: copied trees and rebuilt simple prefixes
+        - sorts: subtrees repositioned, top matches recomputed and match
+          lists sorted
+        - leaves_materialised: (value, weight) matches produced from leaves
+
+    === Attributes ===
+    counts:
+        The counters of each operation: 'insert' (including bulk_load),
+        'autocomplete' (including iter_autocomplete and batch_autocomplete),
+        'remove', and 'other' for work done outside of these (for example
+        while the matches of iter_autocomplete are consumed).
+    operation:
+        The operation currently being counted.
+    """
+    counts: Dict[str, Counter]
+    operation: str
+
+    def __init__(self) -> None:
+        """Initialize counters that are all zero."""
+        self.counts = {operation: Counter() for operation in
+                       ['insert', 'autocomplete', 'remove', 'other']}
+        self.operation = 'other'
+
+    def count(self, counter: str, amount: int = 1) -> None:
+        """Add <amount> to <counter> of the current operation."""
+        self.counts[self.operation][counter] += amount
+
+
+# The counters in use, or None if instrumentation is disabled.
+_stats = None
+# The counters of the explain call running in each thread, if any.
+_explaining = threading.local()
+# Held while instrumentation is enabled or disabled, and while the counting
+# methods are installed or restored.
+_instrumentation_lock = threading.Lock()
+# The number of users of the counting methods: enabled instrumentation, and
+# each running explain call. They are installed while it is not zero.
+_counter_users = 0
+# The counted operations of the prefix tree classes.
+_OPERATIONS = {
+    'insert': 'insert',
+    'bulk_load': 'insert',
+    'autocomplete': 'autocomplete',
+    'iter_autocomplete': 'autocomplete',
+    'batch_autocomplete': 'autocomplete',
+    'remove': 'remove'
+}
+# The helpers that do the counted work, and the counters each call adds to.
+_COUNTED_HELPERS = {
+    '_child': ['nodes_visited', 'prefix_comparisons'],
+    'is_leaf': ['nodes_visited'],
+    '_set_weight': ['nodes_visited'],
+    '_copy': ['list_copies'],
+    '_reposition': ['sorts'],
+    '_refresh_top': ['sorts']
+}
+# The original functions replaced while instrumentation is enabled, keyed by
+# (class or module namespace, name).
+_originals = {}
+
+
+def _current_stats() -> Optional[TraversalStats]:
+    """Return the counters of the explain call running in this thread, or
+    the counters of enabled instrumentation otherwise.
+    """
+    stats = getattr(_explaining, 'stats', None)
+    return _stats if stats is None else stats
+
+
+def _counted_operation(method: Callable, operation: str) -> Callable:
+    """Return <method> counting as one call of <operation>, unless it is
+    called by another counted operation.
+    """
+    def counted(self: Any, *args: Any, **kwargs: Any) -> Any:
+        stats = _current_stats()
+        if stats is None or stats.operation != 'other':
+            return method(self, *args, **kwargs)
+        stats.operation = operation
+        stats.count('calls')
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            stats.operation = 'other'
+    return counted
+
+
+def _counted_helper(method: Callable, counters: List[str]) -> Callable:
+    """Return <method> adding one to each of <counters> when called."""
+    def counted(*args: Any) -> Any:
+        stats = _current_stats()
+        if stats is not None:
+            for counter in counters:
+                stats.count(counter)
+        return method(*args)
+    return counted
+
+
+def _counted_get_all_match(method: Callable) -> Callable:
+    """Return <method> (SimplePrefixTree._get_all_match) counting one sort
+    and the matches it produces.
+    """
+    def counted(self: SimplePrefixTree) -> List[Tuple[Any, float]]:
+        matches = method(self)
+        stats = _current_stats()
+        if stats is not None:
+            stats.count('sorts')
+            stats.count('leaves_materialised', len(matches))
+        return matches
+    return counted
+
+
+def _counted_iter_matches(method: Callable) -> Callable:
+    """Return <method> (SimplePrefixTree._iter_matches) counting every match
+    it produces.
+    """
+    def counted(self: SimplePrefixTree) -> Iterator[Tuple[Any, float]]:
+        for match in method(self):
+            stats = _current_stats()
+            if stats is not None:
+                stats.count('leaves_materialised')
+            yield match
+    return counted
+
+
+def _counted_value(value: property) -> property:
+    """Return the property <value> (SimplePrefixTree.value) counting every
+    prefix it rebuilds.
+    """
+    def counted(self: SimplePrefixTree) -> Any:
+        stats = _current_stats()
+        if stats is not None and self._children is not None:
+            stats.count('list_copies')
+        return value.fget(self)
+    return property(counted, value.fset, doc=value.__doc__)
+
+
+def enable_instrumentation(stats: Optional[TraversalStats] = None
+                           ) -> TraversalStats:
+    """Start counting the work done by every prefix tree in <stats> (new
+    counters if it is None), and return the counters.
+
+    The counting versions of the prefix tree methods are only installed
+    while instrumentation is enabled or explain is running, so disabled
+    instrumentation costs nothing. Counters are shared by all threads.
+    """
+    global _stats
+    with _instrumentation_lock:
+        if _stats is None:
+            _install_counters()
+        _stats = TraversalStats() if stats is None else stats
+        return _stats
+
+
+def disable_instrumentation() -> None:
+    """Stop counting, and restore the original prefix tree methods unless
+    explain is running.
+    """
+    global _stats
+    with _instrumentation_lock:
+        if _stats is not None:
+            _stats = None
+            _restore_counters()
+
+
+def _install_counters() -> None:
+    """Add a user of the counting methods, installing them if it is the
+    first one.
+
+    Precondition: _instrumentation_lock is held.
+    """
+    global _counter_users
+    _counter_users += 1
+    if _counter_users > 1:
+        return
+    namespaces = [(cls, cls.__dict__) for cls in
+                  [SimplePrefixTree, CompressedPrefixTree]]
+    for owner, namespace in namespaces:
+        for name, attribute in list(namespace.items()):
+            if name in _OPERATIONS:
+                counted = _counted_operation(attribute, _OPERATIONS[name])
+            elif name in _COUNTED_HELPERS:
+                counted = _counted_helper(attribute, _COUNTED_HELPERS[name])
+            elif name == '_get_all_match':
+                counted = _counted_get_all_match(attribute)
+            elif name == '_iter_matches':
+                counted = _counted_iter_matches(attribute)
+            elif name == 'value' and owner is SimplePrefixTree:
+                counted = _counted_value(attribute)
+            else:
+                continue
+            _originals[(owner, name)] = attribute
+            setattr(owner, name, counted)
+    _originals[(sys.modules[__name__], 'common_prefix')] = common_prefix
+    globals()['common_prefix'] = _counted_helper(common_prefix,
+                                                 ['prefix_comparisons'])
+
+
+def _restore_counters() -> None:
+    """Remove a user of the counting methods, restoring the original
+    methods if it was the last one.
+
+    Precondition: _instrumentation_lock is held.
+    """
+    global _counter_users
+    _counter_users -= 1
+    if _counter_users > 0:
+        return
+    for (owner, name), attribute in _originals.items():
+        setattr(owner, name, attribute)
+    _originals.clear()
+
+
+################################################################################
+# Versioned prefix trees
+################################################################################
+class VersionedPrefixTree(Autocompleter):
+    """A prefix tree that any number of threads can query while another
+    thread changes it.
+
+    Every version of the tree is immutable once it is published. A write
+    copies the trees on the path of its prefix (*path copying*) and only
+    changes those copies, so the new version shares all other trees with
+    the previous one, which stays intact. The new root is then published with
+    a single assignment: readers never take a lock, never wait for a writer,
+    and never see a partially applied write. Writers wait for each other.
+
+    weight_of uses the leaf index of the newest version, so it may see a
+    write that is being published.
+
+    === Attributes ===
+    _root:
+        The root of the newest published version.
+    _lock:
+        Held while a new version is being written.
+    """
+    _root: SimplePrefixTree
+    _lock: threading.Lock
+
+    def __init__(self, tree: SimplePrefixTree) -> None:
+        """Initialize a versioned prefix tree whose first version is <tree>.
+
+        <tree> must not be changed directly afterwards.
+        """
+        self._root = tree
+        self._lock = threading.Lock()
+
+    def snapshot(self) -> SimplePrefixTree:
+        """Return the newest version of this tree.
+
+        The returned tree never changes, so several queries run on it see
+        the same values, however many writes happen in the meantime.
+        """
+        return self._root
+
+    def __len__(self) -> int:
+        """Return the number of values stored in this Autocompleter."""
+        return len(self._root)
+
+    def insert(self, value: Any, weight: float, prefix: List) -> None:
+        """Insert the given value into a new version of this Autocompleter.
+
+        See Autocompleter.insert.
+        """
+        with self._lock:
+            copies = self._root._copy_path(prefix)
+            root = copies[0]
+            leaf = root._leaves.get(value) if root._leaves is not None \
+                else None
+            if leaf is None:
+                root.insert(value, weight, prefix)
             else:
-                current._update_weight(-current.weight)
-                # sum of self.leave weight instead of self.weight
-            if len(current._before.subtrees) == 1 and not \
-                    current._before.subtrees[0].is_leaf():
-                if current._before._before is not None:
-                    current._before.subtrees[
-                        0]._before = current._before._before
-                    current._before._before.subtrees.remove(current._before)
-                    current._before._before.subtrees.append(
-                        current._before.subtrees[0])
-                    current._before._before._sort_weight()
-                else:
-                    current._before.value = current._before.subtrees[0].value
-                    for i in current._before.subtrees[0].subtrees:
-                        current._before.subtrees.append(i)
-                    current._before.weight = current._before.subtrees[0].weight
-                    current._before.subtrees.pop(0)
-
-            # do we really need else here?
+                # the leaf of a value is a subtree of the tree whose value is
+                # its prefix, which is the last copy
+                parent = copies[-1]
+                copy = leaf._copy()
+                copy._before = parent
+                parent.subtrees[parent.subtrees.index(leaf)] = copy
+                copy._add_weight(weight)
+                root._leaves[value] = copy
+            self._root = root
+
+    def bulk_load(self, entries: Iterable[Tuple[Any, float, List]]) -> None:
+        """Insert every (value, weight, prefix) tuple in <entries> into this
+        Autocompleter.
+
+        If this tree is empty, the entries are bulk loaded into a new tree
+        that is published once complete. Otherwise, every entry is inserted
+        in a new version.
+        """
+        with self._lock:
+            if self._root.is_empty():
+                root = self._root._new_tree()
+                root.bulk_load(entries)
+                self._root = root
+                return
+        Autocompleter.bulk_load(self, entries)
+
+    def autocomplete(self, prefix: List,
+                     limit: Optional[int] = None) -> List[Tuple[Any, float]]:
+        """Return up to <limit> matches for the given prefix, from the newest
+        version of this tree.
+
+        See Autocompleter.autocomplete.
+        """
+        return self._root.autocomplete(prefix, limit)
+
+    def iter_autocomplete(self, prefix: List) -> Iterator[Tuple[Any, float]]:
+        """Yield every match for the given prefix from the version of this
+        tree that is the newest when the method is called.
+
+        See Autocompleter.iter_autocomplete.
+        """
+        return self._root.iter_autocomplete(prefix)
+
+    def batch_autocomplete(self, prefixes: List[List],
+                           limit: Optional[int] = None
+                           ) -> List[List[Tuple[Any, float]]]:
+        """Return the result of autocomplete(prefix, limit) for every prefix in
+        <prefixes>, all from the same version of this tree.
+
+        See Autocompleter.batch_autocomplete.
+        """
+        return self._root.batch_autocomplete(prefixes, limit)
+
+    def fuzzy_autocomplete(self, prefix: List, max_distance: int = 1,
+                           limit: Optional[int] = None
+                           ) -> List[Tuple[Any, float]]:
+        """Return up to <limit> values whose prefix sequence starts with a
+        sequence at most <max_distance> edits away from <prefix>, from the
+        newest version of this tree.
+
+        See Autocompleter.fuzzy_autocomplete.
+        """
+        return self._root.fuzzy_autocomplete(prefix, max_distance, limit)
+
+    def weight_of(self, value: Any) -> float:
+        """Return the weight of <value> in the newest version of this tree,
+        or 0.0 if <value> is not stored in it.
+        """
+        return self._root.weight_of(value)
+
+    def explain(self, prefix: List,
+                limit: Optional[int] = None) -> Dict[str, int]:
+        """Return the counters of the work done by autocomplete(prefix, limit)
+        on the newest version of this tree.
+
+        See SimplePrefixTree.explain.
+        """
+        return self._root.explain(prefix, limit)
+
+    def remove(self, prefix: List) -> None:
+        """Remove all values that match the given prefix from a new version
+        of this Autocompleter.
+        """
+        with self._lock:
+            root = self._root._copy_path(prefix)[0]
+            root.remove(prefix)
+            self._root = root
+
+
+################################################################################
+# Decaying prefix trees
+################################################################################
+class DecayingPrefixTree(Autocompleter):
+    """A prefix tree whose weights decay exponentially over time.
+
+    A weight inserted at some time is halved every <half_life> time units
+    after it. Instead of decaying every stored weight, the tree stores each
+    inserted weight multiplied by the growth 2 ** ((t - epoch) / half_life)
+    of its insertion time t, and weights are multiplied back by the decay
+    of the current time when they are read. Since every stored weight is
+    off by the same factor, aggregate weights and the order of subtrees are
+    exactly those of the decayed weights, and nothing is updated as time
+    passes. Once the growth reaches _RENORMALISE_GROWTH, every stored
+    weight is rescaled once and the epoch moves to the current time.
+
+    === Attributes ===
+    half_life:
+        The time after which a weight is halved, in units of the clock.
+    _tree:
+        The prefix tree of the stored weights.
+    _clock:
+        Returns the current time.
+    _epoch:
+        The time at which stored weights are the actual weights.
+    """
+    half_life: float
+    _tree: SimplePrefixTree
+    _clock: Callable[[], float]
+    _epoch: float
+
+    def __init__(self, tree: SimplePrefixTree, half_life: float,
+                 clock: Callable[[], float] = time.time) -> None:
+        """Initialize a decaying prefix tree that stores its weights in
+        <tree>, with the current time given by <clock> (in seconds since the
+        Unix epoch by default).
+
+        The weights already stored in <tree> are taken as current.
+
+        Precondition: half_life > 0
+        """
+        self.half_life = half_life
+        self._tree = tree
+        self._clock = clock
+        self._epoch = clock()
+
+    def _growth(self) -> float:
+        """Return the factor by which a weight inserted now is stored,
+        renormalising the stored weights first if it has grown too large.
+        """
+        now = self._clock()
+        growth = 2.0 ** ((now - self._epoch) / self.half_life)
+        if growth >= _RENORMALISE_GROWTH:
+            self._tree._scale_weights(1 / growth)
+            self._epoch = now
+            growth = 1.0
+        return growth
+
+    def _decay(self) -> float:
+        """Return the factor by which stored weights are read now."""
+        return 2.0 ** ((self._epoch - self._clock()) / self.half_life)
+
+    def _decayed(self, matches: Iterable[Tuple[Any, float]]
+                 ) -> List[Tuple[Any, float]]:
+        """Return <matches>, with their stored weights read now."""
+        decay = self._decay()
+        return [(value, weight * decay) for value, weight in matches]
+
+    def __len__(self) -> int:
+        """Return the number of values stored in this Autocompleter."""
+        return len(self._tree)
+
+    def insert(self, value: Any, weight: float, prefix: List) -> None:
+        """Insert the given value with the given weight at the current time.
+
+        See Autocompleter.insert.
+        >>> now = [0.0]
+        >>> tree = DecayingPrefixTree(SimplePrefixTree('sum'), 10.0,
+        ...                           lambda: now[0])
+        >>> tree.insert('car', 4.0, ['c', 'a', 'r'])
+        >>> now[0] = 10.0
+        >>> tree.insert('cat', 3.0, ['c', 'a', 't'])
+        >>> tree.autocomplete(['c'])
+        [('cat', 3.0), ('car', 2.0)]
+        """
+        self._tree.insert(value, weight * self._growth(), prefix)
+
+    def bulk_load(self, entries: Iterable[Tuple[Any, float, List]]) -> None:
+        """Insert every (value, weight, prefix) tuple in <entries> at the
+        current time.
+
+        See Autocompleter.bulk_load.
+        """
+        growth = self._growth()
+        self._tree.bulk_load((value, weight * growth, prefix)
+                             for value, weight, prefix in entries)
+
+    def autocomplete(self, prefix: List,
+                     limit: Optional[int] = None) -> List[Tuple[Any, float]]:
+        """Return up to <limit> matches for the given prefix, with their
+        current weights.
+
+        See Autocompleter.autocomplete.
+        """
+        return self._decayed(self._tree.autocomplete(prefix, limit))
+
+    def iter_autocomplete(self, prefix: List) -> Iterator[Tuple[Any, float]]:
+        """Yield every match for the given prefix, with its weight at the
+        time this method is called.
+
+        See Autocompleter.iter_autocomplete.
+        """
+        decay = self._decay()
+        return ((value, weight * decay)
+                for value, weight in self._tree.iter_autocomplete(prefix))
+
+    def batch_autocomplete(self, prefixes: List[List],
+                           limit: Optional[int] = None
+                           ) -> List[List[Tuple[Any, float]]]:
+        """Return the result of autocomplete(prefix, limit) for every prefix in
+        <prefixes>, in the same order.
+
+        See Autocompleter.batch_autocomplete.
+        """
+        return [self._decayed(matches) for matches in
+                self._tree.batch_autocomplete(prefixes, limit)]
+
+    def fuzzy_autocomplete(self, prefix: List, max_distance: int = 1,
+                           limit: Optional[int] = None
+                           ) -> List[Tuple[Any, float]]:
+        """Return up to <limit> values whose prefix sequence starts with a
+        sequence at most <max_distance> edits away from <prefix>, with their
+        current weights.
+
+        See Autocompleter.fuzzy_autocomplete.
+        """
+        return self._decayed(self._tree.fuzzy_autocomplete(
+            prefix, max_distance, limit))
+
+    def weight_of(self, value: Any) -> float:
+        """Return the current weight of <value>, or 0.0 if <value> is not
+        stored in this tree.
+        """
+        return self._tree.weight_of(value) * self._decay()
+
+    def remove(self, prefix: List) -> None:
+        """Remove all values that match the given prefix.
+        """
+        self._tree.remove(prefix)
 
 
 if __name__ == '__main__':
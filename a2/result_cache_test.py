@@ -0,0 +1,112 @@
+import random
+import threading
+import unittest
+from autocomplete_engines import *
+
+
+class ResultCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = ResultCache(3)
+        self.calls = []
+
+    def compute(self, prefix, limit):
+        self.calls.append(prefix)
+        return [(''.join(prefix), 1.0)]
+
+    def test_lru_eviction_and_counters(self):
+        for prefix in [['a'], ['b'], ['a'], ['c'], ['d'], ['a'], ['b']]:
+            self.cache.lookup(prefix, 5, self.compute)
+        self.assertEqual(self.calls, [['a'], ['b'], ['c'], ['d'], ['b']])
+        self.assertEqual(self.cache.stats(),
+                         {'hits': 2, 'misses': 5, 'evictions': 2,
+                          'invalidations': 0, 'size': 3})
+
+    def test_invalidation_is_limited_to_related_prefixes(self):
+        cache = ResultCache(10)
+        for prefix in [[], ['c'], ['c', 'a'], ['c', 'a', 't'], ['d']]:
+            cache.lookup(prefix, None, self.compute)
+        cache.invalidate_remove(['c', 'a'])
+        self.assertEqual(cache.invalidations, 4)
+        cache.lookup(['d'], None, self.compute)
+        self.assertEqual(cache.hits, 1)
+        cache.lookup(['d', 'o'], None, self.compute)
+        cache.invalidate_insert(['d', 'a'])
+        self.assertEqual(len(cache), 1)
+        cache.lookup(['d', 'o'], None, self.compute)
+        self.assertEqual(cache.hits, 2)
+
+    def test_result_invalidated_while_computed_is_not_cached(self):
+        def compute(prefix, limit):
+            self.cache.invalidate_remove(prefix)
+            return self.compute(prefix, limit)
+        def compute_batch(prefixes, limit):
+            self.cache.invalidate_insert(['x'])
+            return [self.compute(prefix, limit) for prefix in prefixes]
+        self.cache.lookup(['a'], None, compute)
+        self.cache.lookup_batch([['b'], ['c']], None, compute_batch)
+        self.assertEqual(len(self.cache), 0)
+        self.cache.lookup(['a'], None, self.compute)
+        self.assertEqual(len(self.cache), 1)
+
+    def test_concurrent_readers_and_writer(self):
+        engine = LetterAutocompleteEngine({
+            'file': 'data/google_no_swears.txt',
+            'autocompleter': 'compressed', 'weight_type': 'sum',
+            'versioned': True, 'result_cache': 5})
+        prefixes = ['', 'a', 'ab', 'b', 'ba', 'h', 'ho', 'how']
+        errors = []
+
+        def read(seed):
+            rng = random.Random(seed)
+            try:
+                for _ in range(2000):
+                    engine.autocomplete(rng.choice(prefixes),
+                                        rng.choice([None, 1, 5]))
+            except Exception as error:
+                errors.append(error)
+
+        readers = [threading.Thread(target=read, args=(seed,))
+                   for seed in range(4)]
+        for reader in readers:
+            reader.start()
+        for i in range(200):
+            engine.insert(f'how {i}', i)
+            engine.remove(f'ab{i % 10}')
+        for reader in readers:
+            reader.join()
+        self.assertEqual(errors, [])
+        for prefix in prefixes:
+            self.assertEqual(engine.autocomplete(prefix, 5),
+                             engine.autocompleter.autocomplete(
+                                 list(prefix), 5))
+
+    def test_engine_results_match_uncached_engine(self):
+        config = {'file': 'data/google_no_swears.txt',
+                  'autocompleter': 'compressed', 'weight_type': 'sum'}
+        cached = LetterAutocompleteEngine(dict(config, result_cache=50))
+        plain = LetterAutocompleteEngine(config)
+        rng = random.Random(148)
+        prefixes = ['', 'a', 'ab', 'abo', 'b', 'ba', 'how', 'ho', 'h']
+        for _ in range(300):
+            prefix = rng.choice(prefixes)
+            operation = rng.random()
+            removed = prefix + rng.choice('aeiou')
+            inserted = prefix + rng.choice('xyz')
+            weight = rng.randint(1, 9)
+            for engine in [cached, plain]:
+                if operation < 0.1:
+                    engine.remove(removed)
+                elif operation < 0.3:
+                    engine.insert(inserted, weight)
+            limit = rng.choice([None, 1, 5])
+            self.assertEqual(cached.autocomplete(prefix, limit),
+                             plain.autocomplete(prefix, limit))
+        self.assertEqual(cached.batch_autocomplete(prefixes, 3),
+                         plain.batch_autocomplete(prefixes, 3))
+        self.assertGreater(cached.result_cache.hits, 0)
+        self.assertGreater(cached.result_cache.invalidations, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
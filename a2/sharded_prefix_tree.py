@@ -0,0 +1,271 @@
+"""CSC148 Assignment 2: Sharded prefix trees
+
+=== Module description ===
+This file contains ShardedAutocompleter, an Autocompleter that spreads its
+values over several worker processes. Each worker owns its own prefix tree,
+so queries on different shards run on different cores, and no process holds
+the whole index.
+
+Values are partitioned by the first element of their prefix sequence, so a
+query with a non-empty prefix only ever needs one shard. Queries with the
+empty prefix (and fuzzy queries, whose first element may be misspelled) are
+sent to every shard, and their matches are merged.
+
+Values and prefix elements are sent to the workers by pickling them, so the
+values returned by a query are copies of the inserted ones.
+"""
+from __future__ import annotations
+import heapq
+import itertools
+import multiprocessing
+import threading
+from multiprocessing.connection import Connection
+from typing import Any, Iterable, List, Optional, Tuple
+
+from prefix_tree import Autocompleter
+
+
+def _serve(connection: Connection, tree_class: type, weight_type: str,
+           cache_limit: int) -> None:
+    """Answer the requests received on <connection> with a new empty prefix
+    tree of <tree_class>, until None is received.
+
+    A request is a (method name, arguments) tuple, and it is answered with
+    (True, the method's result), or (False, the exception it raised).
+    """
+    tree = tree_class(weight_type, cache_limit)
+    while True:
+        request = connection.recv()
+        if request is None:
+            connection.close()
+            return
+        name, args = request
+        try:
+            reply = (True, getattr(tree, name)(*args))
+        except Exception as error:
+            reply = (False, error)
+        connection.send(reply)
+
+
+class ShardedAutocompleter(Autocompleter):
+    """An Autocompleter whose values are stored by a pool of worker processes.
+
+    The values whose prefix sequence starts with the same element are all
+    stored by the same worker, chosen by the hash of that element. Values
+    with an empty prefix sequence are stored by the first worker.
+
+    === Attributes ===
+    _connections:
+        The connection to each worker process.
+    _workers:
+        The worker processes, in the order of their connections.
+    _locks:
+        The lock of each connection, held while requests are sent on it and
+        their replies received, so that each reply is read by the thread
+        that sent the request. Threads querying different shards do not
+        wait for each other. Several locks are always taken in the order
+        of the connections, so that threads cannot deadlock.
+    """
+    _connections: List[Connection]
+    _workers: List[multiprocessing.Process]
+    _locks: List[threading.Lock]
+
+    def __init__(self, tree_class: type, weight_type: str, shards: int,
+                 cache_limit: int = 0) -> None:
+        """Initialize an empty Autocompleter with <shards> worker processes,
+        each owning a new tree_class(weight_type, cache_limit).
+
+        Precondition: tree_class is SimplePrefixTree or one of its
+                      subclasses, and shards > 0.
+        """
+        self._connections = []
+        self._workers = []
+        self._locks = []
+        for _ in range(shards):
+            connection, worker_connection = multiprocessing.Pipe()
+            worker = multiprocessing.Process(
+                target=_serve, daemon=True,
+                args=(worker_connection, tree_class, weight_type,
+                      cache_limit))
+            worker.start()
+            worker_connection.close()
+            self._connections.append(connection)
+            self._workers.append(worker)
+            self._locks.append(threading.Lock())
+
+    def close(self) -> None:
+        """Stop the worker processes. This Autocompleter cannot be used
+        afterwards.
+        """
+        locks = self._locks
+        for lock in locks:
+            lock.acquire()
+        try:
+            for connection in self._connections:
+                connection.send(None)
+                connection.close()
+            for worker in self._workers:
+                worker.join()
+            self._connections = []
+            self._workers = []
+            self._locks = []
+        finally:
+            for lock in locks:
+                lock.release()
+
+    def _shard(self, prefix: List) -> int:
+        """Return the index of the worker that stores the values whose
+        prefix sequence is <prefix>, or starts with <prefix> if it is not
+        empty.
+
+        Only the parent process hashes prefix elements, so the shard of an
+        element does not depend on the hash seed of the workers.
+        """
+        if len(prefix) == 0:
+            return 0
+        return hash(prefix[0]) % len(self._connections)
+
+    def _request(self, requests: List[Tuple[int, str, Tuple]]) -> List[Any]:
+        """Send every (worker index, method name, arguments) request in
+        <requests> to its worker, and return the results in the same order.
+
+        All requests are sent before any reply is awaited, so the workers
+        answer them in parallel. Only the locks of the shards in <requests>
+        are held. If a worker raised an exception, it is raised again here.
+        """
+        locks = [self._locks[shard] for shard in
+                 sorted({shard for shard, _, _ in requests})]
+        for lock in locks:
+            lock.acquire()
+        try:
+            for shard, name, args in requests:
+                self._connections[shard].send((name, args))
+            replies = [self._connections[shard].recv()
+                       for shard, _, _ in requests]
+        finally:
+            for lock in locks:
+                lock.release()
+        for succeeded, result in replies:
+            if not succeeded:
+                raise result
+        return [result for _, result in replies]
+
+    def _scatter(self, name: str, *args: Any) -> List[Any]:
+        """Call method <name> with <args> on every worker's tree, and return
+        their results in the order of the workers.
+        """
+        return self._request([(shard, name, args)
+                              for shard in range(len(self._connections))])
+
+    def __len__(self) -> int:
+        """Return the number of values stored in this Autocompleter."""
+        return sum(self._scatter('__len__'))
+
+    def insert(self, value: Any, weight: float, prefix: List) -> None:
+        """Insert the given value into the worker that stores <prefix>.
+
+        See Autocompleter.insert.
+        """
+        self._request([(self._shard(prefix), 'insert',
+                        (value, weight, prefix))])
+
+    def bulk_load(self, entries: Iterable[Tuple[Any, float, List]]) -> None:
+        """Insert every (value, weight, prefix) tuple in <entries>, sending
+        each worker its own entries at once.
+
+        See Autocompleter.bulk_load.
+        """
+        shards = {}
+        for entry in entries:
+            shards.setdefault(self._shard(entry[2]), []).append(entry)
+        self._request([(shard, 'bulk_load', (shard_entries,))
+                       for shard, shard_entries in shards.items()])
+
+    def autocomplete(self, prefix: List,
+                     limit: Optional[int] = None) -> List[Tuple[Any, float]]:
+        """Return up to <limit> matches for the given prefix, from its worker
+        only unless the prefix is empty.
+
+        See Autocompleter.autocomplete.
+        """
+        if len(prefix) > 0:
+            return self._request([(self._shard(prefix), 'autocomplete',
+                                   (prefix, limit))])[0]
+        return _merged(self._scatter('autocomplete', prefix, limit), limit)
+
+    def batch_autocomplete(self, prefixes: List[List],
+                           limit: Optional[int] = None
+                           ) -> List[List[Tuple[Any, float]]]:
+        """Return the result of autocomplete(prefix, limit) for every prefix in
+        <prefixes>, in the same order, sending each worker a single batch.
+
+        See Autocompleter.batch_autocomplete.
+        """
+        batches = {}
+        for i, prefix in enumerate(prefixes):
+            if len(prefix) > 0:
+                batches.setdefault(self._shard(prefix), []).append(i)
+            else:
+                for shard in range(len(self._connections)):
+                    batches.setdefault(shard, []).append(i)
+        shards = list(batches)
+        replies = self._request([
+            (shard, 'batch_autocomplete',
+             ([prefixes[i] for i in batches[shard]], limit))
+            for shard in shards])
+        parts = [[] for _ in prefixes]
+        for shard, results in zip(shards, replies):
+            for i, matches in zip(batches[shard], results):
+                parts[i].append(matches)
+        return [_merged(part, limit) for part in parts]
+
+    def fuzzy_autocomplete(self, prefix: List, max_distance: int = 1,
+                           limit: Optional[int] = None
+                           ) -> List[Tuple[Any, float]]:
+        """Return up to <limit> values whose prefix sequence starts with a
+        sequence at most <max_distance> edits away from <prefix>, merged
+        from every worker.
+
+        See Autocompleter.fuzzy_autocomplete.
+        """
+        replies = self._scatter('_fuzzy_matches', prefix, max_distance, limit)
+        matches = heapq.merge(*replies,
+                              key=lambda match: (match[0], -match[2]))
+        return [(value, weight) for _, value, weight in
+                itertools.islice(matches, limit)]
+
+    def weight_of(self, value: Any) -> float:
+        """Return the weight of <value> in this Autocompleter, or 0.0 if
+        <value> is not stored in it.
+        """
+        return max(self._scatter('weight_of', value))
+
+    def remove(self, prefix: List) -> None:
+        """Remove all values that match the given prefix, from its worker
+        only unless the prefix is empty.
+        """
+        if len(prefix) > 0:
+            self._request([(self._shard(prefix), 'remove', (prefix,))])
+        else:
+            self._scatter('remove', prefix)
+
+
+def _merged(parts: List[List[Tuple[Any, float]]],
+            limit: Optional[int]) -> List[Tuple[Any, float]]:
+    """Return up to <limit> of the matches in <parts>, in non-increasing
+    order of weight.
+
+    Precondition: every list in <parts> is in non-increasing order of weight.
+    """
+    if len(parts) == 1:
+        return parts[0]
+    return list(itertools.islice(
+        heapq.merge(*parts, key=lambda match: -match[1]), limit))
+
+
+if __name__ == '__main__':
+    import python_ta
+
+    python_ta.check_all(config={
+        'max-nested-blocks': 4
+    })
@@ -0,0 +1,96 @@
+import threading
+import unittest
+from prefix_tree import *
+from sharded_prefix_tree import *
+from autocomplete_engines import SentenceAutocompleteEngine
+
+
+class ShardedTest(unittest.TestCase):
+
+    def setUp(self):
+        self.sharded = ShardedAutocompleter(CompressedPrefixTree, 'sum', 3)
+        self.plain = CompressedPrefixTree('sum')
+        entries = [('car', 3.0, ['c', 'a', 'r']),
+                   ('cat', 2.0, ['c', 'a', 't']),
+                   ('dog', 5.0, ['d', 'o', 'g']),
+                   ('do', 1.0, ['d', 'o']),
+                   ('emu', 4.0, ['e', 'm', 'u']),
+                   ('fig', 6.0, ['f', 'i', 'g'])]
+        self.sharded.bulk_load(entries)
+        self.plain.bulk_load(entries)
+
+    def tearDown(self):
+        self.sharded.close()
+
+    def test_matches_plain_tree(self):
+        self.sharded.insert('cab', 7.0, ['c', 'a', 'b'])
+        self.plain.insert('cab', 7.0, ['c', 'a', 'b'])
+        self.assertEqual(len(self.sharded), 7)
+        for prefix in [[], ['c'], ['d', 'o'], ['x']]:
+            for limit in [None, 1, 3]:
+                self.assertEqual(self.sharded.autocomplete(prefix, limit),
+                                 self.plain.autocomplete(prefix, limit))
+        self.assertEqual(self.sharded.weight_of('dog'), 5.0)
+        self.assertEqual(self.sharded.weight_of('cow'), 0.0)
+        self.assertEqual(self.sharded.fuzzy_autocomplete(['b', 'o'], 1),
+                         self.plain.fuzzy_autocomplete(['b', 'o'], 1))
+
+    def test_batch_matches_single_calls(self):
+        prefixes = [['d'], [], ['c', 'a'], ['q'], []]
+        expected = [self.plain.autocomplete(prefix, 2) for prefix in prefixes]
+        self.assertEqual(self.sharded.batch_autocomplete(prefixes, 2),
+                         expected)
+
+    def test_shards_are_queried_independently(self):
+        shards = {self.sharded._shard([element]): element
+                  for element in 'abcdefghijklmnopqrstuvwxyz'}
+        busy, free = list(shards)[:2]
+        results = []
+        query = threading.Thread(target=lambda: results.append(
+            self.sharded.autocomplete([shards[free]])))
+        with self.sharded._locks[busy]:
+            query.start()
+            query.join(5)
+            self.assertEqual(results,
+                             [self.plain.autocomplete([shards[free]])])
+
+    def test_concurrent_queries(self):
+        errors = []
+
+        def query(prefixes):
+            try:
+                for _ in range(50):
+                    for prefix in prefixes:
+                        if self.sharded.autocomplete(prefix) != \
+                                self.plain.autocomplete(prefix):
+                            errors.append(prefix)
+            except Exception as error:
+                errors.append(error)
+
+        threads = [threading.Thread(target=query, args=(prefixes,))
+                   for prefixes in [[['c'], []], [['d'], ['e']], [[], ['f']]]]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+    def test_remove(self):
+        self.sharded.remove(['d'])
+        self.assertEqual(len(self.sharded), 4)
+        self.assertEqual(self.sharded.autocomplete([], 1), [('fig', 6.0)])
+        self.sharded.remove([])
+        self.assertEqual(len(self.sharded), 0)
+        self.assertEqual(self.sharded.autocomplete([]), [])
+
+    def test_engine_with_shards(self):
+        config = {'file': 'data/sample_sentences.csv',
+                  'autocompleter': 'simple', 'weight_type': 'sum'}
+        expected = SentenceAutocompleteEngine(config).autocomplete('', 2)
+        engine = SentenceAutocompleteEngine(dict(config, shards=2))
+        self.assertEqual(engine.autocomplete('', 2), expected)
+        engine.autocompleter.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,3 +1,6 @@
+import os
+import pickle
+import tempfile
 import unittest
 from prefix_tree import SimplePrefixTree
 
@@ -128,11 +131,106 @@ class SimpleInsertTest(unittest.TestCase):
 
         self.assertEqual(repr_tree(self.avg_tree), expected)
 
-
-
-
-
-
+    def test_weight_of_repeated_value(self):
+        for _ in range(3):
+            self.sum_tree.insert('Gary', 5, ['g', 'a'])
+        self.assertEqual(self.sum_tree.weight_of('Gary'), 15.0)
+        self.assertEqual(self.sum_tree.weight_of('Mary'), 0.0)
+        self.assertEqual(len(self.sum_tree), 1)
+
+    def test_insert_longer_than_recursion_limit(self):
+        prefix = ['a'] * 2000
+        self.sum_tree.insert('long', 5, prefix)
+        self.sum_tree.insert('short', 2, prefix[:1500])
+        self.assertEqual(len(self.sum_tree), 2)
+        self.assertEqual(self.sum_tree.autocomplete(prefix[:1800]),
+                         [('long', 5.0)])
+        self.sum_tree.remove(prefix[:1800])
+        self.assertEqual(self.sum_tree.autocomplete([]), [('short', 2.0)])
+        self.assertTrue(str(self.sum_tree))
+
+
+
+class SimpleBulkLoadTest(unittest.TestCase):
+
+    def test_bulk_load_matches_insert(self):
+        entries = [('ac', 4, ['a', 'c']), ('ab', 6, ['a', 'b']),
+                   ('a', 3, ['a']), ('b', 1, ['b']), ('ac', 4, ['a', 'c'])]
+        for weight_type in ['sum', 'average']:
+            inserted = SimplePrefixTree(weight_type)
+            for value, weight, prefix in entries:
+                inserted.insert(value, weight, prefix)
+            loaded = SimplePrefixTree(weight_type)
+            loaded.bulk_load(entries)
+            self.assertEqual(repr_tree(loaded), repr_tree(inserted))
+            self.assertEqual(len(loaded), 4)
+
+    def test_bulk_load_into_non_empty_tree(self):
+        tree = SimplePrefixTree('sum')
+        tree.insert('ab', 6, ['a', 'b'])
+        tree.bulk_load([('ab', 6, ['a', 'b']), ('b', 1, ['b'])])
+        expected = "Tree([] (13.0) [Tree(['a'] (12.0) [Tree(['a', 'b'] (12.0) " \
+                   "[Tree(ab (12.0))])]), Tree(['b'] (1.0) [Tree(b (1.0))])])"
+        self.assertEqual(repr_tree(tree), expected)
+
+
+class SimpleSnapshotTest(unittest.TestCase):
+
+    def test_save_and_load_snapshot(self):
+        tree = SimplePrefixTree('sum')
+        tree.bulk_load([('ac', 4, ['a', 'c']), ('ab', 6, ['a', 'b']),
+                        ('a', 3, ['a']), ('b', 1, ['b'])])
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, 'tree.snapshot')
+            tree.save(path)
+            loaded = SimplePrefixTree.load(path, cache_limit=2)
+        self.assertEqual(repr_tree(loaded), repr_tree(tree))
+        self.assertEqual(len(loaded), 4)
+        self.assertEqual(loaded.autocomplete(['a'], 2),
+                         [('ab', 6.0), ('ac', 4.0)])
+
+    def test_save_and_load_non_string_values(self):
+        tree = SimplePrefixTree('average')
+        tree.insert((1, 2), 5, [1, 2])
+        tree.insert((1,), 3, [1])
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, 'tree.snapshot')
+            tree.save(path)
+            loaded = SimplePrefixTree.load(path)
+        self.assertEqual(repr_tree(loaded), repr_tree(tree))
+
+    def test_load_refuses_other_classes(self):
+        tree = SimplePrefixTree('sum')
+        tree.insert(Shout('hi'), 1, ['h'])
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, 'tree.snapshot')
+            tree.save(path)
+            self.assertRaises(pickle.UnpicklingError, SimplePrefixTree.load,
+                              path)
+            loaded = SimplePrefixTree.load(path, classes=[Shout])
+            self.assertEqual(loaded.autocomplete([]), [(Shout('hi'), 1.0)])
+            # a crafted value that would call print when unpickled
+            tree = SimplePrefixTree('sum')
+            tree.insert(Crafted(), 1, ['c'])
+            tree.save(path)
+            self.assertRaises(pickle.UnpicklingError, SimplePrefixTree.load,
+                              path, classes=[Shout])
+
+
+class Shout:
+    def __init__(self, text):
+        self.text = text
+
+    def __eq__(self, other):
+        return isinstance(other, Shout) and self.text == other.text
+
+    def __hash__(self):
+        return hash(self.text)
+
+
+class Crafted:
+    def __reduce__(self):
+        return print, ('unpickled',)
 
 
 if __name__ == '__main__':
@@ -71,5 +71,24 @@ class SimpleAutoCompleteTest(unittest.TestCase):
         expected = "Tree([] (6.0) [Tree(['a'] (6.0) [Tree(Alice (6.0)), Tree(['a', 'b'] (6.0) [Tree(Bob (6.0))])])])"
         self.assertEqual(repr_tree(self.avg_tree), expected)
 
+    def test_remove_heaviest_branch_updates_best_matches(self):
+        self.sum_tree.insert('Bob', 9, ['a', 'b', 'c'])
+        self.sum_tree.insert('Alice', 5, ['a', 'd'])
+        self.sum_tree.insert('Jacky', 6, ['e'])
+        self.sum_tree.remove(['a', 'b'])
+        expected = "Tree([] (11.0) [Tree(['e'] (6.0) [Tree(Jacky (6.0))]), " \
+                   "Tree(['a'] (5.0) [Tree(['a', 'd'] (5.0) [Tree(Alice (5.0))])])])"
+        self.assertEqual(repr_tree(self.sum_tree), expected)
+        self.assertEqual(self.sum_tree.autocomplete([], 1), [('Jacky', 6.0)])
+
+    def test_removed_values_have_no_weight(self):
+        self.sum_tree.insert('Bob', 6, ['a', 'b'])
+        self.sum_tree.insert('Alice', 5, ['a', 'c'])
+        self.sum_tree.remove(['a', 'b'])
+        self.assertEqual(self.sum_tree.weight_of('Bob'), 0.0)
+        self.assertEqual(self.sum_tree.weight_of('Alice'), 5.0)
+        self.sum_tree.remove([])
+        self.assertEqual(self.sum_tree.weight_of('Alice'), 0.0)
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,111 @@
+import threading
+import unittest
+from prefix_tree import *
+
+
+def repr_tree(t):
+    if t.is_empty():
+        return ''
+    template = "Tree({} ({})"
+    subtrees = ', '.join([repr_tree(s) for s in t.subtrees])
+    if subtrees:
+        subtrees = ' [' + subtrees + ']'
+    return template.format(t.value, float(t.weight)) + subtrees + ')'
+
+
+class VersionedTest(unittest.TestCase):
+
+    def setUp(self):
+        self.simple = VersionedPrefixTree(SimplePrefixTree('sum'))
+        self.compressed = VersionedPrefixTree(CompressedPrefixTree('average'))
+
+    def test_insert_keeps_old_version(self):
+        for tree in [self.simple, self.compressed]:
+            tree.insert('car', 20.0, ['c', 'a', 'r'])
+            tree.insert('cat', 10.0, ['c', 'a', 't'])
+            old = tree.snapshot()
+            expected = repr_tree(old)
+            tree.insert('cab', 30.0, ['c', 'a', 'b'])
+            tree.insert('car', 5.0, ['c', 'a', 'r'])
+            self.assertEqual(repr_tree(old), expected)
+            self.assertEqual(old.autocomplete(['c'], 1), [('car', 20.0)])
+            self.assertEqual(tree.autocomplete(['c'], 1), [('cab', 30.0)])
+            self.assertEqual(tree.weight_of('car'), 25.0)
+            self.assertEqual(len(tree), 3)
+
+    def test_remove_keeps_old_version(self):
+        for tree in [self.simple, self.compressed]:
+            tree.insert('Hello', 2.0, ['a', 'b', 'c', 'd'])
+            tree.insert('Hey', 2.0, ['a', 'b', 'c', 'q'])
+            tree.insert('bye', 4.0, ['a', 'b', 'f', 'c'])
+            old = tree.snapshot()
+            expected = repr_tree(old)
+            tree.remove(['a', 'b', 'f'])
+            self.assertEqual(repr_tree(old), expected)
+            self.assertEqual(len(old), 3)
+            self.assertEqual(tree.autocomplete([]),
+                             [('Hello', 2.0), ('Hey', 2.0)])
+            tree.remove([])
+            self.assertEqual(len(tree), 0)
+            self.assertEqual(len(old), 3)
+
+    def test_compressed_edges_survive_split_and_merge(self):
+        def answers(version):
+            return [(version.fuzzy_autocomplete(prefix, 0),
+                     version.freeze().autocomplete(prefix))
+                    for prefix in [[], ['a', 'b'], ['a', 'b', 'd'], ['x']]]
+
+        tree = VersionedPrefixTree(CompressedPrefixTree('sum'))
+        for word in ['abc', 'abd', 'abdx']:
+            tree.insert(word, 1.0, list(word))
+        before_split = tree.snapshot()
+        expected_before_split = answers(before_split)
+        # the root ['a', 'b'] is split
+        tree.insert('x', 1.0, ['x'])
+        before_merge = tree.snapshot()
+        expected_before_merge = answers(before_merge)
+        # ['a', 'b'] is merged with its only subtree ['a', 'b', 'd']
+        tree.remove(['a', 'b', 'c'])
+        self.assertEqual(answers(before_split), expected_before_split)
+        self.assertEqual(answers(before_merge), expected_before_merge)
+        self.assertEqual(expected_before_merge[2][0],
+                         [('abd', 1.0), ('abdx', 1.0)])
+        self.assertEqual(answers(tree.snapshot())[2],
+                         expected_before_merge[2])
+
+    def test_compressed_versions_match_plain_tree(self):
+        plain = CompressedPrefixTree('average')
+        entries = [('abcd', 1.0, ['a', 'b', 'c', 'd']),
+                   ('abx', 3.0, ['a', 'b', 'x']),
+                   ('q', 4.0, ['q']),
+                   ('abcd', 2.0, ['a', 'b', 'c', 'd'])]
+        for value, weight, prefix in entries:
+            plain.insert(value, weight, prefix)
+            self.compressed.insert(value, weight, prefix)
+        self.assertEqual(repr_tree(self.compressed.snapshot()),
+                         repr_tree(plain))
+
+    def test_readers_during_writes(self):
+        self.simple.bulk_load([(str(i), 1.0, list(str(i)))
+                               for i in range(100)])
+        errors = []
+
+        def read():
+            for _ in range(200):
+                version = self.simple.snapshot()
+                if len(version.autocomplete([])) != len(version):
+                    errors.append(version)
+
+        readers = [threading.Thread(target=read) for _ in range(4)]
+        for reader in readers:
+            reader.start()
+        for i in range(100, 300):
+            self.simple.insert(str(i), 1.0, list(str(i)))
+        for reader in readers:
+            reader.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(len(self.simple), 300)
+
+
+if __name__ == '__main__':
+    unittest.main()